@@ -0,0 +1,46 @@
+import collections
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from run_metrics import METRICS
+
+
+# Function run in a worker process: apply `func` to every argument tuple of a
+# chunk, returning the results with the metrics the worker recorded meanwhile
+def run_chunk(func, chunk):
+    results = [func(*args) for args in chunk]
+    return results, METRICS.take()
+
+
+# Function to apply `func` to argument tuples on a pool of worker processes.
+# Items are sent in chunks of `chunk_size` to keep inter-process overhead low,
+# at most two chunks per worker are outstanding so the input is consumed
+# lazily, and results are yielded in input order. `func` must be a module
+# level function; worker processes import its module once, which loads the
+# pattern and group files a single time per worker. The metrics recorded in
+# the workers are merged into this process's.
+def map_in_order(func, items, workers, chunk_size=64):
+    if not workers:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        for args in items:
+            yield func(*args)
+        return
+
+    items = iter(items)
+    pending = collections.deque()
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        while True:
+            chunk = list(itertools.islice(items, chunk_size))
+            if chunk:
+                pending.append(pool.submit(run_chunk, func, chunk))
+            if pending and (not chunk or len(pending) >= workers * 2):
+                results, metrics = pending.popleft().result()
+                METRICS.merge(metrics)
+                yield from results
+            if not chunk and not pending:
+                break
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,133 @@
+import hashlib
+import os
+import threading
+import time
+
+from config import RULES_CHECK_INTERVAL
+from patterns import SameGroups
+
+RULE_FILES = {
+    "bad": "bad.txt",
+    "expired": "expired.txt",
+    "same": "same.txt",
+}
+
+
+# Function to read a pattern list (bad.txt, expired.txt): one entry per line
+def read_pattern_list(path):
+    with open(path, "r") as f:
+        return [line.strip() for line in f.readlines()]
+
+
+# Function to read same.txt into a {nameserver: main nameserver} dictionary
+# (a SameGroups, which also indexes the wildcard entries).
+# The first nameserver of a group is its main NS. Blank lines are filtered
+# out before grouping, as they always have been, so every entry belongs to
+# the group of the file's first line.
+def read_same_groups(path):
+    same_groups = {}
+    with open(path, "r") as f:
+        lines = [line.strip() for line in f if line.strip()]
+        current_main_ns = None
+        for line in lines:
+            if not line:
+                current_main_ns = None
+                continue
+            if not current_main_ns:
+                current_main_ns = line
+
+            same_groups[line] = current_main_ns
+    return SameGroups(same_groups)
+
+
+READERS = {
+    "bad": read_pattern_list,
+    "expired": read_pattern_list,
+    "same": read_same_groups,
+}
+
+
+# The rule files of an analyzer (bad.txt, expired.txt, same.txt), loaded on
+# first use rather than at import time.
+# `build(config)` compiles what the analyzer needs from the files, reading
+# them with `config.get(name)`; only the files it asks for are opened. The
+# compiled rules are cached and rebuilt when one of the files it read
+# changes on disk; modification times are checked at most once every
+# RULES_CHECK_INTERVAL seconds, so `rules()` is cheap enough to call per domain.
+# Files are looked up in `folder`, relative to the working directory the
+# config is created in, like the scripts have always resolved them.
+class AnalyzerConfig:
+    def __init__(self, build, folder="", check_interval=RULES_CHECK_INTERVAL):
+        self.build = build
+        self.folder = os.path.join(os.getcwd(), folder)
+        self.check_interval = check_interval
+        self.loads = 0
+        self._files = {}
+        self._rules = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._digest = None
+        self._digest_stamps = None
+
+    def path(self, name):
+        return os.path.join(self.folder, RULE_FILES[name])
+
+    # Returns the parsed content of a rule file, reading it on first use
+    def get(self, name):
+        loaded = self._files.get(name)
+        if loaded is None:
+            path = self.path(name)
+            mtime = os.stat(path).st_mtime_ns
+            loaded = (path, mtime, READERS[name](path))
+            self._files[name] = loaded
+        return loaded[2]
+
+    # Returns a digest of the content of all the rule files, recomputed when
+    # one of them changes on disk. Stored verdicts are keyed on it.
+    def digest(self):
+        stamps = tuple(self._stamp(name) for name in RULE_FILES)
+        if stamps != self._digest_stamps:
+            digest = hashlib.blake2b(digest_size=16)
+            for name in RULE_FILES:
+                try:
+                    with open(self.path(name), "rb") as f:
+                        digest.update(f.read())
+                except FileNotFoundError:
+                    digest.update(b"-")
+                digest.update(b"\0")
+            self._digest = digest.hexdigest()
+            self._digest_stamps = stamps
+        return self._digest
+
+    def _stamp(self, name):
+        try:
+            stat = os.stat(self.path(name))
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    # Returns the (path, mtime) of every file read so far
+    def sources(self):
+        return {name: (path, mtime) for name, (path, mtime, _) in self._files.items()}
+
+    def _changed(self):
+        for path, mtime, _ in self._files.values():
+            try:
+                if os.stat(path).st_mtime_ns != mtime:
+                    return True
+            except FileNotFoundError:
+                return True
+        return False
+
+    def rules(self):
+        rules = self._rules
+        now = time.monotonic()
+        if rules is not None and now - self._checked_at < self.check_interval:
+            return rules
+        with self._lock:
+            if self._rules is None or self._changed():
+                self._files = {}
+                self._rules = self.build(self)
+                self.loads += 1
+            self._checked_at = now
+            return self._rules
@@ -0,0 +1,111 @@
+import types
+
+from config import EXTRA_FOLDER
+from analyzer_config import AnalyzerConfig
+from patterns import PatternSet, SameGroups
+from ns_normalizer import NsNormalizer
+from ns_table import open_ns_table
+from ns_events import parse_day
+from run_metrics import METRICS
+
+# BAD list rules (the ns_checker logic): flags a domain when any of its
+# nameservers ever matched bad.txt, or when cloudflare.com was seen on a
+# single day within the last year.
+
+VERDICT_VERSION = 1  # Bump when a change to the rules changes their results
+
+
+# Function to compile the bad nameservers list from bad.txt
+def build_rules(config):
+    patterns = PatternSet(config.get("bad"), [])
+    return types.SimpleNamespace(
+        patterns=patterns,
+        # Registrable domain of a nameserver and whether it is in bad.txt,
+        # shared through the verdict table
+        normalizer=NsNormalizer(
+            SameGroups(),
+            flags=lambda tld: (patterns.in_bad_list(tld), False),
+            table=open_ns_table("bad-list", config, VERDICT_VERSION),
+        ),
+    )
+
+
+# Rule files, loaded on first use and reloaded when they change
+ANALYZER_CONFIG = AnalyzerConfig(build_rules, EXTRA_FOLDER)
+
+
+# Function to extract the top-level domain (TLD) from a nameserver
+def extract_tld(ns):
+    return ANALYZER_CONFIG.rules().normalizer.extract_tld(ns)
+
+
+# Function to process nameserver changes for a domain; without `data` the
+# domain's history is fetched here
+def process_domain_for_bad_list(domain, current_date, data=None):
+    if data is None:
+        # history_checker imports this module, so it is imported on use
+        from history_checker import fetch_ns_history
+
+        data = fetch_ns_history(domain)
+    if "error" in data:
+        return None, f"Domain: {domain} - Error: {data['error']}"
+
+    filtered_events = data.get("events", [])
+    if not filtered_events:
+        return None, None
+
+    rules = ANALYZER_CONFIG.rules()
+    bad_domain = False
+    cloudflare_first_seen = None
+    cloudflare_recent_seen = None
+    ns_lookups = 0
+
+    for event in filtered_events:
+        ns_set = {rules.normalizer.extract_tld(ns) for ns in event["nameservers"]}
+        ns_lookups += len(event["nameservers"])
+
+        # Check if any nameserver in the change is in the BAD_NS_LIST
+        if any(rules.normalizer.is_bad(ns) for ns in event["nameservers"]):
+            bad_domain = True
+            # Nothing later can clear the flag, so the rest of the history
+            # does not need to be read
+            break
+
+        # Check for cloudflare.com conditions
+        if "cloudflare.com" in ns_set:
+            # Safely handle missing or None dates
+            event_date_str = event.get("date", {}).get("date")
+            if event_date_str:
+                event_date = parse_day(event_date_str)
+                if not cloudflare_first_seen:
+                    cloudflare_first_seen = event_date
+                cloudflare_recent_seen = event_date
+
+    METRICS.inc("ns_lookups", ns_lookups)
+
+    # Check if cloudflare.com condition is met
+    if cloudflare_recent_seen and cloudflare_first_seen:
+        if current_date.toordinal() - cloudflare_recent_seen <= 365 and cloudflare_first_seen == cloudflare_recent_seen:
+            bad_domain = True
+
+    return domain if bad_domain else None, None
+
+
+# Rule engine entry point: what the BAD list flag depends on besides the
+# history itself, i.e. bad.txt and the day of the run clock
+def verdict_key(current_date):
+    return f"bad-list/{VERDICT_VERSION}/{ANALYZER_CONFIG.digest()}/{current_date.toordinal()}"
+
+
+# Rule engine entry point: merges the nameserver verdicts computed during the
+# run, by this process and the analysis workers, into the shared table
+def save_ns_table():
+    return ANALYZER_CONFIG.rules().normalizer.save()
+
+
+# Rule engine entry point: marks the domain's record as flagged for the BAD list
+def analyse_domain(record, data, current_date):
+    bad_domain, error = process_domain_for_bad_list(record["domain"], current_date, data)
+    record["bad"] = bool(bad_domain)
+    if error:
+        record["errors"].append(error)
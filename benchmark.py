@@ -0,0 +1,204 @@
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from synthetic_history import generate_histories, add_options, options_from
+from mock_completedns import MockCompleteDNS
+from rate_limiter import RateLimiter, set_rate_limiter
+
+BENCHMARKS = ("analysis", "fetch", "main")
+
+
+# Per-call latencies of a benchmark
+class Samples:
+    def __init__(self):
+        self.values = []
+
+    # Wraps `func` so that the duration of every call is recorded
+    def timed(self, func):
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.values.append(time.perf_counter() - started)
+
+        return wrapper
+
+    def percentile(self, fraction):
+        if not self.values:
+            return 0.0
+        values = sorted(self.values)
+        return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+# Function to get the peak resident set size of this process and its
+# children (analysis workers) in MB, None where it is not available
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak += resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+# Function to build the result of a benchmark
+def result(name, domains, elapsed, samples):
+    return {
+        "benchmark": name,
+        "domains": domains,
+        "seconds": round(elapsed, 3),
+        "domains_per_sec": round(domains / elapsed, 1) if elapsed else None,
+        "p50_ms": round(samples.percentile(0.50) * 1000, 3),
+        "p99_ms": round(samples.percentile(0.99) * 1000, 3),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+# Function to set up the mock API (started by `with`) and point the checker
+# at it, with the rate limiter at `args.rate` requests/s and no daily quota
+def mock_api(args, options):
+    import history_checker
+
+    mock = MockCompleteDNS(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        seed=args.seed,
+        **options,
+    )
+    history_checker.API_URL = mock.url
+    history_checker.API_KEY = "benchmark"
+    set_rate_limiter(RateLimiter(rate=args.rate, daily_quota=0))
+    return mock
+
+
+# Function to benchmark the report analysis (process_ns_history) on
+# synthetic histories, without any I/O
+def bench_analysis(args, options):
+    import report_rules
+
+    current_date = datetime.datetime.now()
+    histories = [data for data in generate_histories(args.domains, args.seed, **options)]
+    samples = Samples()
+    analyse = samples.timed(report_rules.process_ns_history)
+    started = time.perf_counter()
+    for data in histories:
+        analyse(data, current_date)
+    return result("analysis", len(histories), time.perf_counter() - started, samples)
+
+
+# Function to benchmark fetch_ns_history against the mock API with
+# CONCURRENCY threads, starting from an empty history cache
+def bench_fetch(args, options):
+    import history_checker
+    from config import CONCURRENCY, MAX_IN_FLIGHT
+    from fetch_pool import fetch_in_order
+
+    domains = [f"domain{i}.com" for i in range(args.domains)]
+    samples = Samples()
+    fetch = samples.timed(history_checker.fetch_ns_history)
+    with mock_api(args, options):
+        started = time.perf_counter()
+        for _ in fetch_in_order(domains, fetch, CONCURRENCY, MAX_IN_FLIGHT):
+            pass
+        elapsed = time.perf_counter() - started
+    return result("fetch", len(domains), elapsed, samples)
+
+
+# Function to benchmark a whole run of main() against the mock API: fetch,
+# analysis and report files, with an empty history cache. The latencies are
+# those of the fetches, as seen by the run.
+def bench_main(args, options):
+    import history_checker
+
+    with open("domains.txt", "w") as f:
+        f.write("\n".join(f"domain{i}.com" for i in range(args.domains)))
+    samples = Samples()
+    history_checker.fetch_ns_history = samples.timed(history_checker.fetch_ns_history)
+    with mock_api(args, options):
+        started = time.perf_counter()
+        history_checker.main("domains.txt", "report.csv", "errors.txt")
+        elapsed = time.perf_counter() - started
+    return result("main", args.domains, elapsed, samples)
+
+
+# Function to run one benchmark in a fresh process, so that peak RSS and
+# the caches are its own
+def run_isolated(name, argv):
+    command = [sys.executable, os.path.abspath(__file__), "--only", name] + argv
+    output = subprocess.run(command, check=True, stdout=subprocess.PIPE, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+# Function to get the command line options of a benchmark process: the
+# parsed values of the options shared with it, without the benchmark names
+def child_argv(parser, args):
+    argv = []
+    for action in parser._actions:
+        if not action.option_strings or action.dest in ("help", "only", "json"):
+            continue
+        value = getattr(args, action.dest)
+        if value is not None:
+            argv += [action.option_strings[0], str(value)]
+    return argv
+
+
+# Function to print the results as a table
+def print_table(results):
+    print(f"{'benchmark':<10} {'domains':>8} {'seconds':>9} {'domains/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'peak RSS MB':>12}")
+    for r in results:
+        print(
+            f"{r['benchmark']:<10} {r['domains']:>8} {r['seconds']:>9} {r['domains_per_sec']:>10} "
+            f"{r['p50_ms']:>9} {r['p99_ms']:>9} {str(r['peak_rss_mb']):>12}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the checker offline on synthetic histories")
+    parser.add_argument("benchmarks", nargs="*", default=list(BENCHMARKS), help=f"benchmarks to run ({', '.join(BENCHMARKS)})")
+    parser.add_argument("--domains", type=int, default=2000, help="number of synthetic domains")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds the mock API takes to answer")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra seconds of mock API latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of mock API answers that are 500/429")
+    parser.add_argument("--rate", type=float, default=0, help="requests per second allowed by the rate limiter, 0 for no limit")
+    parser.add_argument("--json", metavar="FILE", help="also write the results to a JSON file")
+    parser.add_argument("--only", choices=BENCHMARKS, help=argparse.SUPPRESS)
+    add_options(parser)
+    args = parser.parse_args()
+    options = options_from(args)
+
+    if args.only:
+        # Child process: run the benchmark in a scratch directory, so the
+        # history cache, quota state and reports start empty
+        # The rule files are looked up from the working directory when
+        # history_checker is imported: the repository's, wherever this runs from
+        os.chdir(os.path.dirname(os.path.abspath(__file__)))
+        import history_checker
+
+        benchmark = {"analysis": bench_analysis, "fetch": bench_fetch, "main": bench_main}[args.only]
+        with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as scratch:
+            os.chdir(scratch)
+            print(json.dumps(benchmark(args, options)))
+        sys.exit(0)
+
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+    argv = child_argv(parser, args)
+    results = [run_isolated(name, argv) for name in args.benchmarks]
+    print_table(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,40 @@
+import gzip
+import logging
+
+from lazy_history import loads_history
+from run_metrics import METRICS
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+logger = logging.getLogger(__name__)
+
+
+# Function to open a JSON lines dump, transparently decompressing gzip files
+def open_dump(path):
+    with open(path, "rb") as f:
+        magic = f.read(2)
+    if magic == GZIP_MAGIC:
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+# Function to stream (domain, history) pairs from a JSONL/NDJSON dump of
+# CompleteDNS responses ({"domain": ..., "events": [...]} per line).
+# Records are decoded one line at a time, so memory does not depend on the
+# size of the dump; lines that cannot be decoded are logged and skipped.
+# Large records are decoded lazily (see lazy_history.py): only their first
+# fields are checked here, the events are decoded by the analysis.
+def iter_dump(path):
+    with open_dump(path) as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                with METRICS.timer("decode"):
+                    record = loads_history(line)
+                domain = record["domain"]
+            except (ValueError, KeyError, TypeError) as e:
+                logger.warning("Skipping line %s of %s: %s", line_number, path, e)
+                continue
+            yield domain, record
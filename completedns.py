@@ -0,0 +1,154 @@
+import email.utils
+import logging
+import random
+import threading
+import time
+
+from config import (
+    CONCURRENCY,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_READ_TIMEOUT,
+    HTTP_RETRIES,
+    HTTP_BACKOFF,
+    HTTP_MAX_BACKOFF,
+)
+from lazy_history import loads_history
+from rate_limiter import get_rate_limiter
+from run_metrics import METRICS
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+logger = logging.getLogger(__name__)
+
+
+# Running count, total and maximum of API request latencies
+class LatencyStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+
+    def summary(self):
+        if not self.count:
+            return "API requests: 0"
+        return (
+            f"API requests: {self.count}, avg {self.total / self.count:.3f}s, "
+            f"max {self.max:.3f}s"
+        )
+
+
+LATENCY = LatencyStats()
+
+_session = None
+_session_lock = threading.Lock()
+
+
+# Function to get the shared keep-alive session, sized for CONCURRENCY threads.
+# requests is imported on first use, so importing the analyzers stays fast.
+def get_session():
+    global _session
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    with _session_lock:
+        if _session is None:
+            pool_size = max(CONCURRENCY, 1)
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            _session = requests.Session()
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+    return _session
+
+
+# Function to compute the jittered exponential delay before retry `attempt`
+def backoff_delay(attempt):
+    delay = min(HTTP_MAX_BACKOFF, HTTP_BACKOFF * 2 ** attempt)
+    return random.uniform(delay / 2, delay)
+
+
+# Function to read a Retry-After header given in seconds or as an HTTP date
+def retry_after(response):
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return min(HTTP_MAX_BACKOFF, max(0.0, float(value)))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return min(HTTP_MAX_BACKOFF, max(0.0, when.timestamp() - time.time()))
+
+
+# Function to GET a history from the CompleteDNS API.
+# Every attempt waits for the shared rate limiter. Connection errors,
+# timeouts, 429 and 5xx responses are retried with backoff; any other
+# failure is returned as {"error": message}.
+# Extra request `headers` (e.g. If-None-Match) are sent as given; a 304 answer
+# is returned as {"not_modified": True}. The ETag and Last-Modified headers
+# of a successful response are stored in the `meta` dict when one is passed.
+def fetch_history(url, params, headers=None, meta=None):
+    import requests
+
+    session = get_session()
+    limiter = get_rate_limiter()
+    error = None
+    for attempt in range(HTTP_RETRIES + 1):
+        limiter.acquire()
+        if attempt:
+            METRICS.inc("api_retries")
+        started = time.perf_counter()
+        try:
+            with METRICS.tracking("api_in_flight"):
+                response = session.get(
+                    url,
+                    params=params,
+                    headers=headers,
+                    timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT),
+                )
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = str(e)
+            delay = backoff_delay(attempt)
+        except requests.RequestException as e:
+            return {"error": str(e)}
+        else:
+            latency = time.perf_counter() - started
+            LATENCY.record(latency)
+            METRICS.observe("api_request", latency)
+            logger.debug("GET %s -> %s in %.3fs", url, response.status_code, latency)
+            if response.status_code == 429:
+                METRICS.inc("api_throttled")
+                limiter.throttled()
+            else:
+                limiter.succeeded()
+            if response.status_code == 304:
+                return {"not_modified": True}
+            if response.status_code not in RETRY_STATUSES or attempt == HTTP_RETRIES:
+                try:
+                    response.raise_for_status()
+                    if meta is not None:
+                        meta["etag"] = response.headers.get("ETag")
+                        meta["last_modified"] = response.headers.get("Last-Modified")
+                    with METRICS.timer("decode"):
+                        return loads_history(response.content)
+                except (requests.RequestException, ValueError) as e:
+                    METRICS.inc("api_failures")
+                    return {"error": str(e)}
+            error = f"{response.status_code} Error for url: {response.url}"
+            delay = retry_after(response)
+            if delay is None:
+                delay = backoff_delay(attempt)
+        if attempt < HTTP_RETRIES:
+            logger.debug("Retrying %s in %.1fs: %s", url, delay, error)
+            time.sleep(delay)
+    METRICS.inc("api_failures")
+    return {"error": error}
@@ -1,3 +1,47 @@
 FULL_REPORT = 1  # Set to 1 for full report, 0 to disable
 GOOD_REPORT = 1  # Set to 1 for good domains report, 0 to disable
 BAD_REPORT = 1   # Set to 1 for bad domains report, 0 to disable
+EXTRA_FOLDER = ""  # Folder (under the working directory) of domains.txt, bad.txt, expired.txt and same.txt
+
+CONCURRENCY = 8     # Number of CompleteDNS requests running in parallel, 1 to fetch one at a time
+MAX_IN_FLIGHT = 32  # Maximum number of domains fetched ahead of the one being processed
+STREAM_OUTPUT = 0   # Set to 1 to write report rows as domains are classified instead of at the end
+FLAGGED_SEEN_SIZE = 65536  # Recent BAD list domains remembered to write a repeated input domain once when streaming
+
+ANALYSIS_WORKERS = 1      # Processes analysing histories, 0 for one per CPU core
+ANALYSIS_CHUNK_SIZE = 64  # Domains sent to an analysis process at a time
+
+CACHE_FILE = "ns_history_cache.sqlite3"  # Local cache of API responses, "" to disable
+CACHE_TTL_DAYS = 7            # Cached histories older than this are fetched again
+CACHE_MAX_ENTRIES = 1000000   # Least recently used domains are evicted beyond this count
+CACHE_ONLY = 0                # Set to 1 to never call the API and use cached histories only
+
+INCREMENTAL = 0                      # Set to 1 to reuse the verdicts of unchanged histories and revalidate expired cache entries
+VERDICT_FILE = "ns_verdicts.sqlite3"  # Last verdict of every domain, used by the incremental mode
+
+NS_CACHE_SIZE = 65536  # Normalized nameserver hosts (and distinct NS sets) kept in memory
+RULES_CHECK_INTERVAL = 5  # Seconds between two checks of bad.txt, expired.txt and same.txt for changes
+
+HTTP_CONNECT_TIMEOUT = 5  # Seconds allowed to connect to the API
+HTTP_READ_TIMEOUT = 30    # Seconds allowed for the API to answer
+HTTP_RETRIES = 4          # Retries after connection errors, timeouts, 429 and 5xx responses
+HTTP_BACKOFF = 1.0        # Base delay in seconds of the exponential retry backoff
+HTTP_MAX_BACKOFF = 60     # Longest delay in seconds between two retries
+
+RATE_LIMIT = 0    # Maximum CompleteDNS requests per second, 0 for no limit (e.g. 10 for a plan that caps the rate)
+RATE_BURST = 10   # Requests allowed back to back before RATE_LIMIT applies
+DAILY_QUOTA = 0   # CompleteDNS requests allowed per day, 0 for no limit
+QUOTA_STATE_FILE = "quota_state.json"  # Requests used today, shared between runs
+
+JOURNAL_SYNC_EVERY = 100  # Journal records written to disk between two fsync calls
+
+METRICS_INTERVAL = 10  # Seconds between two progress summary lines, 0 for a summary at the end only
+
+METRICS_FILE = ""      # File the run metrics are written to with each summary (.prom for Prometheus text, JSON otherwise), "" for none
+
+PROFILE_EVERY = 100  # With --profile, one domain in this many is profiled
+PROFILE_TOP = 25     # Hot functions and allocation sites listed in the profile summary
+
+LAZY_DECODE_MIN_BYTES = 65536  # Histories at least this large are decoded lazily, only as far as the analysis reads them
+
+NS_TABLE_FILE = "ns_table.bin"  # Nameserver verdicts shared by runs and analysis processes (ns_table.<analyzer>.bin), "" to disable
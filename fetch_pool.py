@@ -0,0 +1,29 @@
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Function to fetch histories for many domains concurrently.
+# Requests run on a thread pool while the caller processes earlier results,
+# at most `max_in_flight` of them are outstanding at any time, and the
+# (domain, data) pairs are yielded back in input order.
+def fetch_in_order(domains, fetch, workers, max_in_flight=None):
+    if workers <= 1:
+        for domain in domains:
+            yield domain, fetch(domain)
+        return
+
+    if not max_in_flight or max_in_flight < workers:
+        max_in_flight = workers
+    pending = collections.deque()
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        for domain in domains:
+            pending.append((domain, pool.submit(fetch, domain)))
+            if len(pending) >= max_in_flight:
+                done_domain, future = pending.popleft()
+                yield done_domain, future.result()
+        while pending:
+            done_domain, future = pending.popleft()
+            yield done_domain, future.result()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,188 @@
+import os
+import sqlite3
+import threading
+import time
+
+from config import CACHE_FILE, CACHE_TTL_DAYS, CACHE_MAX_ENTRIES, CACHE_ONLY
+from lazy_history import loads_history, dumps_history
+from run_metrics import METRICS
+
+
+# SQLite store of CompleteDNS history responses keyed by domain.
+# Entries older than `ttl_days` are treated as misses (unless stale entries
+# are explicitly allowed) and the least recently used entries are evicted
+# once the store holds more than `max_entries` domains. The ETag and
+# Last-Modified validators of a response are kept with it, so an expired
+# entry can be revalidated with a conditional request.
+class HistoryCache:
+    def __init__(self, path, ttl_days=CACHE_TTL_DAYS, max_entries=CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl_days * 86400
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS history ("
+            "domain TEXT PRIMARY KEY, body TEXT NOT NULL, "
+            "fetched_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS history_accessed ON history (accessed_at)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(history)")}
+        for column in ("etag", "last_modified"):
+            if column not in columns:
+                # Caches created before the validators were kept
+                self._conn.execute(f"ALTER TABLE history ADD COLUMN {column} TEXT")
+        self._size = self._conn.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+
+    def get(self, domain, allow_stale=False):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body, fetched_at FROM history WHERE domain = ?", (domain,)
+            ).fetchone()
+            if row is None or (not allow_stale and now - row[1] > self.ttl):
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE history SET accessed_at = ? WHERE domain = ?", (now, domain)
+            )
+            self.hits += 1
+        return loads_history(row[0])
+
+    # Returns whether a domain has an entry that get() would serve, without
+    # counting it as a hit or a miss
+    def has_fresh(self, domain):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT fetched_at FROM history WHERE domain = ?", (domain,)
+            ).fetchone()
+        return row is not None and time.time() - row[0] <= self.ttl
+
+    # Returns the conditional request headers of a cached entry, if it has validators
+    def conditional_headers(self, domain):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified FROM history WHERE domain = ?", (domain,)
+            ).fetchone()
+        headers = {}
+        if row is not None:
+            if row[0]:
+                headers["If-None-Match"] = row[0]
+            if row[1]:
+                headers["If-Modified-Since"] = row[1]
+        return headers
+
+    # Marks a cached entry as fetched now (the API answered 304) and returns it
+    def refresh(self, domain):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body FROM history WHERE domain = ?", (domain,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE history SET fetched_at = ?, accessed_at = ? WHERE domain = ?",
+                (now, now, domain),
+            )
+            self.hits += 1
+        return loads_history(row[0])
+
+    def put(self, domain, data, etag=None, last_modified=None):
+        now = time.time()
+        body = dumps_history(data)
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO history "
+                "(domain, body, fetched_at, accessed_at, etag, last_modified) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (domain, body, now, now, etag, last_modified),
+            )
+            if cursor.rowcount:
+                self._size += 1
+            else:
+                self._conn.execute(
+                    "UPDATE history SET body = ?, fetched_at = ?, accessed_at = ?, "
+                    "etag = ?, last_modified = ? WHERE domain = ?",
+                    (body, now, now, etag, last_modified, domain),
+                )
+            if self.max_entries and self._size > self.max_entries:
+                self._evict(self._size - self.max_entries)
+
+    def _evict(self, count):
+        self._conn.execute(
+            "DELETE FROM history WHERE domain IN "
+            "(SELECT domain FROM history ORDER BY accessed_at LIMIT ?)",
+            (count,),
+        )
+        self._size = self._conn.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+# Function to open the cache configured in config.py (None when disabled)
+def get_history_cache():
+    global _default_cache
+    if not CACHE_FILE:
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = HistoryCache(os.path.join(os.getcwd(), CACHE_FILE))
+    return _default_cache
+
+
+# Function to count the domains of a batch whose history needs an API
+# request: those the cache cannot serve, none in CACHE_ONLY mode
+def count_misses(domains):
+    if CACHE_ONLY:
+        return 0
+    cache = get_history_cache()
+    if cache is None:
+        return len(domains)
+    return sum(1 for domain in domains if not cache.has_fresh(domain))
+
+
+# Function to serve a domain's history from the cache, calling `fetch` on a miss.
+# Only successful responses are stored; in CACHE_ONLY mode the API is never called.
+# With `revalidate`, `fetch(domain, headers, meta)` is called with the
+# conditional headers of an expired entry, which is kept when the API
+# answers that it has not been modified.
+def fetch_cached(domain, fetch, revalidate=False):
+    cache = get_history_cache()
+    if cache is not None:
+        data = cache.get(domain, allow_stale=bool(CACHE_ONLY))
+        if data is not None:
+            METRICS.inc("history_cache_hits")
+            return data
+        METRICS.inc("history_cache_misses")
+    if CACHE_ONLY:
+        return {"error": f"{domain} is not in the history cache"}
+
+    data = None
+    meta = {}
+    if revalidate and cache is not None:
+        headers = cache.conditional_headers(domain)
+        if headers:
+            data = fetch(domain, headers, meta)
+            if data.get("not_modified"):
+                data = cache.refresh(domain)
+                if data is not None:
+                    METRICS.inc("history_cache_revalidated")
+                    return data
+    if data is None:
+        data = fetch(domain, None, meta) if revalidate else fetch(domain)
+    if cache is not None and "error" not in data and "error_type" not in data:
+        cache.put(domain, data, meta.get("etag"), meta.get("last_modified"))
+    return data
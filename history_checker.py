@@ -0,0 +1,427 @@
+import argparse
+import collections
+import datetime
+import functools
+import itertools
+import logging
+import os
+
+# Load configurations from config.py
+from config import (
+    FULL_REPORT,
+    GOOD_REPORT,
+    BAD_REPORT,
+    CONCURRENCY,
+    MAX_IN_FLIGHT,
+    STREAM_OUTPUT,
+    ANALYSIS_WORKERS,
+    ANALYSIS_CHUNK_SIZE,
+    EXTRA_FOLDER,
+    INCREMENTAL,
+    METRICS_FILE,
+    PROFILE_EVERY,
+)
+from fetch_pool import fetch_in_order
+from bulk_source import iter_dump
+from analysis_pool import map_in_order
+from completedns import LATENCY, fetch_history
+from history_cache import count_misses, fetch_cached
+from rate_limiter import get_rate_limiter
+from run_journal import RunJournal
+from verdict_store import get_verdict_store, history_fingerprint
+from run_metrics import METRICS, ProgressReporter
+from run_profile import RunProfiler, profiled
+from report_writer import REPORT_COLUMNS, StreamingReport, classify_frame, conclusions, needed_columns
+import report_rules
+import bad_list_rules
+
+# Constants and configurations
+API_KEY = ""  # API key for CompleteDNS API
+API_URL = ""  # API endpoint for DNS history
+
+# Rule engines that can score a fetched history. Each one adds its verdict
+# to the domain's record with analyse_domain(record, data, current_date):
+# "report" the report row (report, Good and Bad files), "bad-list" the BAD
+# list flag (BAD file). verdict_key(current_date) describes what else than
+# the history the verdict depends on, and save_ns_table() merges the
+# nameserver verdicts the run computed into the engine's shared table.
+RULE_ENGINES = {
+    "report": report_rules,
+    "bad-list": bad_list_rules,
+}
+DEFAULT_ENGINES = ("report", "bad-list")
+
+
+# Function to get a domain's history, from the local cache when possible.
+# With `revalidate` an expired cache entry is checked with a conditional request.
+def fetch_ns_history(domain, revalidate=False):
+    with METRICS.timer("fetch"):
+        return fetch_cached(domain, request_ns_history, revalidate)
+
+
+# Function to call the CompleteDNS API
+def request_ns_history(domain, headers=None, meta=None):
+    return fetch_history(f"{API_URL}/{domain}?", {"key": API_KEY}, headers, meta)
+
+
+# Function to compute the key a domain's verdict is stored under
+def verdict_key(data, current_date, engines):
+    parts = [history_fingerprint(data)]
+    parts.extend(RULE_ENGINES[engine].verdict_key(current_date) for engine in engines)
+    return "|".join(parts)
+
+
+# Function to analyse one fetched domain into a journal record: the report
+# row (None when there is none), whether the analysis succeeded, the error
+# lines for the domain and, with the BAD list rules, whether it was flagged.
+# Every enabled rule engine runs over the same decoded history. A `stored`
+# record of an unchanged history is returned as it is.
+def analyse_domain(domain, data, current_date, engines=DEFAULT_ENGINES, stored=None):
+    if stored is not None:
+        return stored
+    record = {"domain": domain, "row": None, "ok": False, "errors": []}
+    if "error" in data:
+        record["errors"].append(f"Domain: {domain} - Error: {data['error']}")
+        return record
+    try:
+        with METRICS.timer("analysis"):
+            for engine in engines:
+                RULE_ENGINES[engine].analyse_domain(record, data, current_date)
+    except ValueError as e:
+        # A lazily decoded history that is malformed past its first events
+        record = {"domain": domain, "row": None, "ok": False, "errors": []}
+        record["errors"].append(f"Domain: {domain} - Error: invalid history: {e}")
+    return record
+
+
+# Function to analyse (domain, history) pairs, journaling each record and
+# counting it in the run's `progress`.
+# With ANALYSIS_WORKERS other than 1 the analysis runs on a process pool.
+# With a verdict `store` the domains whose history, rule files and run date
+# are unchanged since their stored verdict are not analysed again.
+# With a `profiler` the analysis is sampled by it, in this process.
+# Records are yielded in the order of `source`.
+def process_domains(source, current_date, journal, engines, progress, store=None, profiler=None):
+    keys = collections.deque()
+
+    def items():
+        for domain, data in source:
+            key = stored = None
+            if store is not None and "error" not in data:
+                try:
+                    key = verdict_key(data, current_date, engines)
+                except ValueError:
+                    key = None  # Malformed history, reported by its analysis
+                else:
+                    stored = store.get(domain, key)
+            if stored is not None:
+                key = data = None
+            keys.append(key)
+            yield domain, data, current_date, engines, stored
+
+    analyse, workers = analyse_domain, ANALYSIS_WORKERS
+    if profiler is not None:
+        analyse, workers = profiler.sampled(analyse_domain), 1
+    records = map_in_order(analyse, items(), workers, ANALYSIS_CHUNK_SIZE)
+    for record in records:
+        key = keys.popleft()
+        if key is not None:
+            store.put(record["domain"], key, record)
+        METRICS.inc("domains")
+        if record["errors"]:
+            METRICS.inc("domain_errors")
+        progress.tick()
+        logging.debug("Processed %s: %s", progress.done, record["domain"])
+        if journal:
+            journal.append(record)
+        yield record
+
+
+# Function to match input items against the records journaled by an
+# interrupted run: yields (item, record), the record being None for the
+# items still to process. The journal holds the records of the items
+# processed so far in input order, so both are read side by side and no
+# record is kept in memory. `domain` gets the domain of an item.
+def journaled_in_order(items, records, domain=lambda item: item):
+    record = next(records, None)
+    for item in items:
+        if record is not None and record["domain"] == domain(item):
+            yield item, record
+            record = next(records, None)
+        else:
+            yield item, None
+
+
+# Function to merge journaled and newly processed records in `domains` order
+def records_in_order(domains, journaled, processed):
+    for _, record in journaled_in_order(domains, journaled):
+        if record is None:
+            record = next(processed)
+        yield record
+
+
+# Journaled main function: every processed domain is appended to `journal_file`
+# and with `resume` the domains already in the journal are not processed again
+# (resume with the same input and rule engines as the interrupted run).
+# With `dump_file` the histories are read from a (gzip) JSONL dump instead of
+# the API and the domains are those of the dump, in dump order.
+# With `stream` each domain's outputs are written as soon as it is
+# classified; otherwise they are built at the end from all records in input
+# order. Each domain is fetched once, whatever the enabled `engines`.
+# With `incremental` the verdicts are stored, and reused for the domains whose
+# history and rules have not changed; expired cached histories are
+# revalidated with conditional requests instead of downloaded again.
+# Progress is logged every METRICS_INTERVAL seconds; with `metrics_file` the
+# run's metrics are also written there (Prometheus text for a .prom file).
+# With `profile_every` one domain analysis in that many, and the report
+# stage, run under cProfile and tracemalloc; the profile is written to
+# profile_<run date>.pstats with a summary of the hot spots in profile_<run date>.txt.
+def main(
+    input_file,
+    output_file,
+    error_file,
+    journal_file=None,
+    resume=False,
+    stream=STREAM_OUTPUT,
+    dump_file=None,
+    current_date=None,
+    engines=DEFAULT_ENGINES,
+    incremental=INCREMENTAL,
+    metrics_file=METRICS_FILE,
+    profile_every=0,
+):
+    # The run clock: every date cut-off of the analysis is taken from it
+    if current_date is None:
+        current_date = datetime.datetime.now()
+    engines = tuple(engines)
+    if "report" not in engines:
+        # Without the report there is no error file, the errors are logged
+        error_file = None
+
+    METRICS.reset()
+    profiler = RunProfiler(profile_every) if profile_every else None
+    if profiler is not None and ANALYSIS_WORKERS != 1:
+        logging.info("Profiling: the analysis runs in this process instead of ANALYSIS_WORKERS processes")
+    store = get_verdict_store() if incremental else None
+    journal = RunJournal(journal_file, resume) if journal_file else None
+
+    # Function to read back the records of an interrupted run
+    def journaled():
+        return journal.records() if journal else iter(())
+
+    if dump_file:
+        # The journal of an interrupted run holds a prefix of the dump
+        progress = ProgressReporter(done=journal.count if journal else 0, metrics_file=metrics_file)
+        source = (
+            item
+            for item, record in journaled_in_order(iter_dump(dump_file), journaled(), lambda item: item[0])
+            if record is None
+        )
+        processed = process_domains(source, current_date, journal, engines, progress, store, profiler)
+        ordered = itertools.chain(journaled(), processed)
+    else:
+        domains = []
+        with open(input_file, "r") as f:
+            domains = [line.strip() for line in f.readlines()]
+        pending = [domain for domain, record in journaled_in_order(domains, journaled()) if record is None]
+        progress = ProgressReporter(len(domains), len(domains) - len(pending), metrics_file=metrics_file)
+        # The daily quota is only spread over the domains the cache cannot serve
+        limiter = get_rate_limiter()
+        if limiter.daily_quota:
+            limiter.plan(count_misses(pending))
+        fetch = functools.partial(fetch_ns_history, revalidate=True) if incremental else fetch_ns_history
+        source = fetch_in_order(pending, fetch, CONCURRENCY, MAX_IN_FLIGHT)
+        processed = process_domains(source, current_date, journal, engines, progress, store, profiler)
+        ordered = records_in_order(domains, journaled(), processed)
+
+    if stream:
+        write_streaming(ordered, current_date, output_file, error_file, engines, profiler)
+    else:
+        write_batch(ordered, current_date, output_file, error_file, engines, profiler)
+    if journal:
+        journal.close()
+    if store is not None:
+        logging.info(store.summary())
+    for engine in engines:
+        hosts = RULE_ENGINES[engine].save_ns_table()
+        if hosts is not None:
+            logging.info(f"Nameserver table of the {engine} rules: {hosts} hosts")
+    progress.close()
+    if profiler is not None:
+        stats_file, summary_file = profiler.write(f'profile_{current_date.strftime("%Y%m%d_%H%M%S")}')
+        logging.info(f"Profile written to {stats_file}, hot spots in {summary_file}")
+
+
+# Function to log the error lines of a run that has no error file
+def log_errors(errors):
+    if errors:
+        logging.error("Errors encountered:")
+        for error in errors:
+            logging.error(error)
+
+
+# Function to write the outputs domain by domain, in input order
+# (with a `profiler`, the report lines it samples are profiled)
+def write_streaming(records, current_date, output_file, error_file, engines=DEFAULT_ENGINES, profiler=None):
+    report_enabled = "report" in engines
+    report = StreamingReport(
+        report_file=output_file if report_enabled and FULL_REPORT else None,
+        good_file=f'Good_{current_date.strftime("%Y%d%m_%H%M%S")}.txt' if report_enabled and GOOD_REPORT else None,
+        bad_file=f'Bad_{current_date.strftime("%Y%d%m_%H%M%S")}.txt' if report_enabled and BAD_REPORT else None,
+        error_file=error_file if FULL_REPORT else None,
+        flagged_file=f'BAD_{current_date.strftime("%Y%m%d_%H%M%S")}.txt' if "bad-list" in engines else None,
+    )
+    add = profiler.sampled(report.add, "report") if profiler is not None else report.add
+    errors = []
+    try:
+        for record in records:
+            with METRICS.timer("output"):
+                add(record)
+            if not error_file:
+                errors.extend(record["errors"])
+    finally:
+        report.close()
+    logging.info(LATENCY.summary())
+    logging.info(report.summary())
+    log_errors(errors)
+
+
+# Function to write the outputs once every domain has been processed
+# (with a `profiler`, the whole report stage is profiled)
+def write_batch(records, current_date, output_file, error_file, engines=DEFAULT_ENGINES, profiler=None):
+    results = []
+    success = []
+    errors = []
+    flagged = {}  # Domains flagged by the BAD list rules, in input order
+    for record in records:
+        errors.extend(record["errors"])
+        if record["row"] is not None:
+            results.append(record["row"])
+            success.append(record["ok"])
+        if record.get("bad"):
+            flagged[record["domain"]] = True
+
+    logging.info(LATENCY.summary())
+    with METRICS.timer("output"), profiled(profiler, "report"):
+        if not error_file:
+            log_errors(errors)
+        elif errors and FULL_REPORT:
+            with open(error_file, "w") as f:
+                f.write("\n".join(errors))
+
+        # Write BAD_DATE_TIME.txt for the BAD list rules
+        if flagged:
+            bad_list_file = f'BAD_{current_date.strftime("%Y%m%d_%H%M%S")}.txt'
+            with open(bad_list_file, "w") as f:
+                f.write("\n".join(flagged))
+
+        if "report" not in engines or not (FULL_REPORT or GOOD_REPORT or BAD_REPORT):
+            return
+
+        # pandas is only needed here, so it is not imported with the module
+        import numpy as np
+        import pandas as pd
+
+        # Only the columns of the enabled outputs are loaded and classified
+        needed = needed_columns()
+        columns = [c for c in REPORT_COLUMNS + ["Longest NS Years"] if c == "Domain" or c in needed]
+        df = pd.DataFrame(results, columns=columns)
+        good_mask, bad_mask = classify_frame(
+            df,
+            np.array(success, dtype=bool),
+            good=bool(FULL_REPORT or GOOD_REPORT),
+            bad=bool(FULL_REPORT or BAD_REPORT),
+        )
+
+        if any(success):
+            if GOOD_REPORT:
+                good_file = f'Good_{current_date.strftime("%Y%d%m_%H%M%S")}.txt'
+                df.loc[good_mask, "Domain"].to_csv(good_file, index=False, header=False)
+            if BAD_REPORT:
+                bad_file = f'Bad_{current_date.strftime("%Y%d%m_%H%M%S")}.txt'
+                df.loc[bad_mask, "Domain"].to_csv(bad_file, index=False, header=False)
+
+        if FULL_REPORT:
+            df["Conclusion"] = conclusions(df, good_mask, bad_mask)
+            df.to_csv(output_file, index=False, columns=REPORT_COLUMNS)
+
+
+# Function to run the command line: `engines` are the rule engines enabled
+# by default and `journal_name` the journal file of the script
+def run_cli(engines=DEFAULT_ENGINES, journal_name="history_checker_journal.jsonl", description="Nameserver history checker"):
+    # Configure logging
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    input_file = os.path.join(os.getcwd(), EXTRA_FOLDER, "domains.txt")
+    current_date = datetime.datetime.now().strftime("%Y-%m-%d")
+    today = datetime.datetime.today()
+
+    output_file = f'report_{current_date}_{today.strftime("%Y%d%m_%H%M%S")}.csv'
+    error_file = f'errors_{current_date}_{today.strftime("%Y%d%m_%H%M%S")}.txt'
+    journal_file = os.path.join(os.getcwd(), EXTRA_FOLDER, journal_name)
+
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument(
+        "--rules",
+        default=",".join(engines),
+        help=f"comma separated rule engines to run ({', '.join(RULE_ENGINES)}), default: %(default)s",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="skip the domains already in the journal of an interrupted run",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        default=bool(STREAM_OUTPUT),
+        help="write each domain's outputs as soon as it is classified",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        default=bool(INCREMENTAL),
+        help="reuse the stored verdicts of domains whose history and rules have not changed",
+    )
+    parser.add_argument(
+        "--metrics",
+        metavar="FILE",
+        default=METRICS_FILE or None,
+        help="write the run's metrics to FILE (Prometheus text for a .prom file, JSON otherwise)",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        type=int,
+        const=PROFILE_EVERY,
+        default=0,
+        metavar="N",
+        help=f"profile one domain analysis in every N (default {PROFILE_EVERY}) and the report stage",
+    )
+    parser.add_argument(
+        "--dump",
+        metavar="FILE",
+        help="read the histories from a JSONL dump (optionally gzip-compressed) instead of the API",
+    )
+    args = parser.parse_args()
+    engines = [engine.strip() for engine in args.rules.split(",") if engine.strip()]
+    unknown = [engine for engine in engines if engine not in RULE_ENGINES]
+    if unknown or not engines:
+        parser.error(f"unknown rule engines: {', '.join(unknown)}" if unknown else "no rule engine given")
+    main(
+        input_file,
+        output_file,
+        error_file,
+        journal_file,
+        args.resume,
+        args.stream,
+        args.dump,
+        engines=engines,
+        incremental=args.incremental,
+        metrics_file=args.metrics,
+        profile_every=args.profile,
+    )
+
+
+if __name__ == "__main__":
+    run_cli()
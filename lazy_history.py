@@ -0,0 +1,199 @@
+import json
+import re
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from config import LAZY_DECODE_MIN_BYTES
+
+# Fast decoder when orjson is installed, the standard library otherwise
+loads = orjson.loads if orjson is not None else json.loads
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+DECODER = json.JSONDecoder()
+
+
+# Function to decode a CompleteDNS history (str or bytes). Bodies of at
+# least LAZY_DECODE_MIN_BYTES are wrapped in a LazyHistory, so their events
+# are only decoded as far as the analysis reads them; smaller ones are
+# decoded at once, which is faster for them.
+def loads_history(body):
+    if len(body) < LAZY_DECODE_MIN_BYTES:
+        return loads(body)
+    if isinstance(body, (bytes, bytearray)):
+        body = body.decode(json.detect_encoding(body))
+    if not body.lstrip().startswith("{"):
+        return loads(body)
+    return LazyHistory(body)
+
+
+# Function to get the JSON text of a decoded history, without encoding a
+# LazyHistory again
+def dumps_history(data):
+    if isinstance(data, LazyHistory):
+        return data.text
+    return json.dumps(data, separators=(",", ":"))
+
+
+# A history object decoded on demand from its JSON text.
+# The fields before "events" are decoded up front. The events are decoded
+# one at a time as they are iterated and kept for the next reader, so an
+# analysis that stops at a date cut-off never decodes the rest of the
+# history. The fields after "events" are decoded once the events are.
+# Reading a field that is not there only decodes the whole history when
+# the field's name occurs somewhere in the text.
+# Malformed JSON raises ValueError where the decoding reaches it.
+class LazyHistory:
+    def __init__(self, text):
+        self.text = text
+        self._fields = {}
+        self._decoded = []
+        self._events = None
+        self._pos = None  # Position of the next event in `text`, None once all are decoded
+        self._expect_event = False
+        self._done = False
+        pos = self._skip(0)
+        if text[pos:pos + 1] != "{":
+            raise ValueError("A history must be a JSON object")
+        self._members(pos + 1)
+
+    def __reduce__(self):
+        return LazyHistory, (self.text,)
+
+    def __repr__(self):
+        return f"<LazyHistory {len(self.text)} chars, {len(self._decoded)} events decoded>"
+
+    def _skip(self, pos):
+        return WHITESPACE.match(self.text, pos).end()
+
+    # Decodes `"key": value` members from `pos` up to the closing brace,
+    # stopping at the opening bracket of an "events" array
+    def _members(self, pos):
+        text = self.text
+        pos = self._skip(pos)
+        if text[pos:pos + 1] == "}":
+            self._finish(pos + 1)
+            return
+        while True:
+            key, pos = DECODER.raw_decode(text, pos)
+            if not isinstance(key, str):
+                raise ValueError(f"Expecting a property name at char {pos}")
+            pos = self._skip(pos)
+            if text[pos:pos + 1] != ":":
+                raise ValueError(f"Expecting ':' delimiter at char {pos}")
+            pos = self._skip(pos + 1)
+            if key == "events" and text[pos:pos + 1] == "[":
+                self._events = LazyEvents(self)
+                self._decoded = []
+                self._fields.pop("events", None)
+                self._pos = self._skip(pos + 1)
+                self._expect_event = False
+                return
+            value, pos = DECODER.raw_decode(text, pos)
+            self._fields[key] = value
+            if key == "events":
+                self._events = None
+            pos = self._skip(pos)
+            if text[pos:pos + 1] == ",":
+                pos = self._skip(pos + 1)
+                continue
+            if text[pos:pos + 1] == "}":
+                self._finish(pos + 1)
+                return
+            raise ValueError(f"Expecting ',' delimiter at char {pos}")
+
+    # Decodes the next event; returns False when there are no more
+    def _next_event(self):
+        if self._pos is None:
+            return False
+        text = self.text
+        pos = self._pos
+        if text[pos:pos + 1] == "]" and not self._expect_event:
+            pos = self._skip(pos + 1)
+            self._pos = None
+            if text[pos:pos + 1] == ",":
+                self._members(pos + 1)
+            elif text[pos:pos + 1] == "}":
+                self._finish(pos + 1)
+            else:
+                raise ValueError(f"Expecting ',' delimiter at char {pos}")
+            return False
+        event, pos = DECODER.raw_decode(text, pos)
+        self._decoded.append(event)
+        pos = self._skip(pos)
+        self._expect_event = text[pos:pos + 1] == ","
+        if self._expect_event:
+            pos = self._skip(pos + 1)
+        elif text[pos:pos + 1] != "]":
+            raise ValueError(f"Expecting ',' delimiter at char {pos}")
+        self._pos = pos
+        return True
+
+    # Marks the history as fully decoded once only whitespace follows its closing brace
+    def _finish(self, pos):
+        pos = self._skip(pos)
+        if pos != len(self.text):
+            raise ValueError(f"Extra data at char {pos}")
+        self._done = True
+
+    def _decode_all(self):
+        while self._next_event():
+            pass
+
+    def _may_contain(self, key):
+        return f'"{key}"' in self.text or "\\" in self.text
+
+    def __contains__(self, key):
+        if key in self._fields or (key == "events" and self._events is not None):
+            return True
+        if self._done or not self._may_contain(key):
+            return False
+        self._decode_all()
+        return key in self._fields
+
+    def __getitem__(self, key):
+        if key == "events" and self._events is not None:
+            return self._events
+        if key not in self._fields and not self._done and self._may_contain(key):
+            self._decode_all()
+        return self._fields[key]
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def keys(self):
+        self._decode_all()
+        keys = list(self._fields)
+        if self._events is not None:
+            keys.append("events")
+        return keys
+
+    # Returns the history as a plain dict, decoding all of it
+    def to_dict(self):
+        return loads(self.text)
+
+
+# The events of a LazyHistory, decoded as they are iterated
+class LazyEvents:
+    def __init__(self, history):
+        self.history = history
+
+    def __iter__(self):
+        history = self.history
+        decoded = history._decoded
+        i = 0
+        while True:
+            if i < len(decoded):
+                yield decoded[i]
+                i += 1
+            elif not history._next_event():
+                return
+
+    def __bool__(self):
+        return bool(self.history._decoded) or self.history._next_event()
+
+    def __len__(self):
+        self.history._decode_all()
+        return len(self.history._decoded)
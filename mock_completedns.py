@@ -0,0 +1,111 @@
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from synthetic_history import history_for, add_options, options_from
+
+
+# Request handler of the mock API: GET /<domain>?key=... answers with the
+# synthetic history of the domain, after the server's latency, or with a
+# 500/429 error at the server's error rate.
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # Headers and body are written separately
+
+    def do_GET(self):
+        server = self.server
+        domain = urllib.parse.urlsplit(self.path).path.strip("/")
+        with server.lock:
+            server.requests += 1
+            delay = server.latency + server.rng.uniform(0, server.jitter)
+            failed = server.rng.random() < server.error_rate
+            status = server.rng.choice([500, 429]) if failed else 200
+        if delay:
+            time.sleep(delay)
+        if status == 200:
+            body = json.dumps(history_for(domain, server.seed, **server.options)).encode("utf-8")
+        else:
+            body = json.dumps({"error": "mock failure"}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 429:
+            self.send_header("Retry-After", "0")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Local stand-in for the CompleteDNS API serving synthetic histories.
+# Every domain always gets the same history for a given seed. `latency`
+# and `jitter` (seconds) delay each answer, `error_rate` is the share of
+# requests answered with a 500 or 429 error.
+# Point API_URL at `url` to run the checker against it.
+class MockCompleteDNS:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, error_rate=0.0, seed=1, **options):
+        self.server = ThreadingHTTPServer((host, port), MockHandler)
+        self.server.daemon_threads = True
+        self.server.latency = latency
+        self.server.jitter = jitter
+        self.server.error_rate = error_rate
+        self.server.seed = seed
+        self.server.options = options
+        self.server.rng = random.Random(seed)
+        self.server.lock = threading.Lock()
+        self.server.requests = 0
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def requests(self):
+        return self.server.requests
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve synthetic histories like the CompleteDNS API")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every answer")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra seconds, up to this much")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 500/429")
+    add_options(parser)
+    args = parser.parse_args()
+    mock = MockCompleteDNS(
+        port=args.port,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        seed=args.seed,
+        **options_from(args),
+    )
+    print(f"Serving synthetic histories on {mock.url}")
+    try:
+        mock.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,124 @@
+import datetime
+import functools
+
+from run_metrics import METRICS
+
+
+# One nameserver period of a domain's history: the interned NS set id and the
+# start/end dates as day ordinals (date.toordinal()); `end` is None until known.
+class NsPeriod:
+    __slots__ = ("ns_id", "start", "end")
+
+    def __init__(self, ns_id, start, end=None):
+        self.ns_id = ns_id
+        self.start = start
+        self.end = end
+
+
+# Function to turn a day ordinal back into a date
+def from_ordinal(ordinal):
+    return datetime.date.fromordinal(ordinal)
+
+
+# Function to parse a "YYYY-MM-DD" event date into a day ordinal.
+# Histories repeat the same dates a lot, so results are memoized; dates that
+# date.fromisoformat rejects (e.g. unpadded "2020-1-5") go through strptime.
+@functools.lru_cache(maxsize=65536)
+def parse_day(text):
+    try:
+        return datetime.date.fromisoformat(text).toordinal()
+    except ValueError:
+        return datetime.datetime.strptime(text, "%Y-%m-%d").toordinal()
+
+
+# Function to turn a cut-off moment into the last day ordinal strictly before it
+def last_ordinal_before(moment):
+    ordinal = moment.toordinal()
+    if moment == moment.replace(hour=0, minute=0, second=0, microsecond=0):
+        ordinal -= 1
+    return ordinal
+
+
+# Function to compute the day ordinal cut-offs of a run from its clock `now`
+# (the run's current_date): periods are analysed when they start before
+# `now - exclude_days`, and the open last period ends at `now - tail_days`.
+@functools.lru_cache(maxsize=8)
+def run_cutoffs(now, exclude_days, tail_days):
+    ns_end_limit = last_ordinal_before(now - datetime.timedelta(days=exclude_days))
+    tail_end = (now - datetime.timedelta(days=tail_days)).toordinal()
+    return ns_end_limit, tail_end
+
+
+# Interning table for the NS group sets seen in histories.
+# Each distinct set gets a small integer id, and everything the analysis
+# needs to know about a set is computed once when it is first seen.
+# Sets are keyed by their iteration order, because the report picks "the"
+# nameserver of a set as the first one iterated; `members` compares them
+# as sets.
+#   members    - the set as a frozenset
+#   first      - the nameserver reported for the set (first in iteration order)
+#   last       - the last nameserver in iteration order
+#   bad_count  - how many of its nameservers match bad.txt
+#   has_bad    - whether any of them matches bad.txt
+#   has_expired - whether any of them matches expired.txt
+#   no_expired_substring - no expired.txt pattern (without "*") occurs in `first`
+#   change_key - the set of same.txt groups of its non-expired nameservers,
+#                used to count unique NS changes (None when empty)
+# The bad.txt/expired.txt flags of a nameserver are `flags(ns)` when given
+# (e.g. the verdicts of the NS normalizer), matched against the patterns
+# otherwise. The pattern matching of new sets is timed in the "match" metric.
+class NsSetTable:
+    def __init__(self, patterns, map_group, max_size, flags=None):
+        self.patterns = patterns
+        self.map_group = map_group
+        self.max_size = max_size
+        self.flags = flags or (lambda ns: (patterns.is_bad(ns), patterns.is_expired(ns)))
+        self.substrings = [pattern.strip("*") for pattern in patterns.expired_patterns]
+        self.clear()
+
+    def clear(self):
+        self.ids = {}
+        self.members = []
+        self.first = []
+        self.last = []
+        self.bad_count = []
+        self.has_bad = []
+        self.has_expired = []
+        self.no_expired_substring = []
+        self.change_key = []
+
+    def __len__(self):
+        return len(self.first)
+
+    # Called between domains so the table stays bounded on very large batches
+    def trim(self):
+        if len(self) > self.max_size:
+            self.clear()
+
+    def intern(self, ns_set):
+        ordered = tuple(ns_set)
+        ns_id = self.ids.get(ordered)
+        if ns_id is not None:
+            return ns_id
+
+        patterns = self.patterns
+        with METRICS.timer("match"):
+            flags = [self.flags(ns) for ns in ordered]
+            bad_count = sum(1 for bad, _ in flags if bad)
+            change_key = frozenset(
+                self.map_group(ns) for ns in ordered if not patterns.contains_expired(ns)
+            )
+            has_expired = any(expired for _, expired in flags)
+        ns_id = len(self.first)
+        self.ids[ordered] = ns_id
+        self.members.append(frozenset(ordered))
+        self.first.append(ordered[0])
+        self.last.append(ordered[-1])
+        self.bad_count.append(bad_count)
+        self.has_bad.append(bool(bad_count))
+        self.has_expired.append(has_expired)
+        self.no_expired_substring.append(
+            not any(substring in ordered[0] for substring in self.substrings)
+        )
+        self.change_key.append(change_key or None)
+        return ns_id
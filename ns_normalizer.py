@@ -0,0 +1,103 @@
+import functools
+import importlib.metadata
+
+from config import NS_CACHE_SIZE
+from run_metrics import METRICS
+
+VERDICT_VERSION = 2  # Bump when a change to the normalization or same.txt grouping changes its results
+
+
+# Function to build the offline suffix extractor.
+# An empty URL list makes tldextract use the public suffix snapshot bundled
+# with the package instead of downloading the live list on first use.
+# tldextract is imported here, on the first nameserver to normalize.
+@functools.lru_cache(maxsize=None)
+def offline_extractor():
+    import tldextract
+
+    extractor = tldextract.TLDExtract(suffix_list_urls=(), cache_dir=None)
+    extractor("example.com")  # load the snapshot once, here
+    return extractor
+
+
+# Function to get the version of the verdicts computed by NsNormalizer:
+# VERDICT_VERSION and the tldextract release, whose bundled public suffix
+# snapshot decides the registrable domains. Read from the package metadata,
+# so tldextract is not imported for it.
+@functools.lru_cache(maxsize=None)
+def verdict_version():
+    try:
+        tldextract_version = importlib.metadata.version("tldextract")
+    except importlib.metadata.PackageNotFoundError:
+        tldextract_version = "none"
+    return f"{VERDICT_VERSION}/tldextract-{tldextract_version}"
+
+
+# Maps raw nameserver hosts to their verdict: (registrable domain, same.txt
+# main NS, bad flag, expired flag), the flags being `flags(main NS)`.
+# The main NS is that of the longest same.txt entry matching the host:
+# the exact entry of its registrable domain or a wildcard entry (see
+# patterns.SameGroups), else the registrable domain itself.
+# Results are kept in a bounded LRU keyed on the raw host, so the hosts that
+# repeat across a batch are normalized once; only those misses are timed, in
+# the "normalize" metric. Hosts for which `keep_host` returns True (e.g.
+# expired.txt matches) are kept as they are.
+# With a verdict `table` (see ns_table.py) a miss is looked up there first,
+# and the hosts computed are added to it; save() merges them into the table
+# file for the next runs and the other analysis processes.
+class NsNormalizer:
+    def __init__(self, same_groups, keep_host=None, maxsize=NS_CACHE_SIZE, flags=None, table=None):
+        self.same_groups = same_groups
+        self.keep_host = keep_host
+        self.flags = flags
+        self.table = table
+        self.group_flags = {}
+        self.maxsize = maxsize
+        self.normalize = functools.lru_cache(maxsize=maxsize)(self._normalize)
+
+    def _normalize(self, host):
+        with METRICS.timer("normalize"):
+            verdict = None
+            if self.table is not None:
+                verdict = self.table.get(host)
+                METRICS.inc("ns_table_hits" if verdict is not None else "ns_table_misses")
+            if verdict is None:
+                verdict = self.compute(host)
+                if self.table is not None:
+                    self.table.add(host, verdict)
+            if len(self.group_flags) >= self.maxsize:
+                self.group_flags.clear()
+            self.group_flags[verdict[1]] = verdict[2:]
+            return verdict
+
+    def compute(self, host):
+        if self.keep_host is not None and self.keep_host(host):
+            tld = host
+        else:
+            details = offline_extractor()(host)
+            tld = f"{details.domain}.{details.suffix}"
+        group = self.same_groups.match(host, tld) or tld
+        bad, expired = self.flags(group) if self.flags is not None else (False, False)
+        return tld, group, bad, expired
+
+    def extract_tld(self, host):
+        return self.normalize(host)[0]
+
+    def group(self, host):
+        return self.normalize(host)[1]
+
+    def is_bad(self, host):
+        return self.normalize(host)[2]
+
+    # Returns the (bad, expired) flags of a main NS, from the hosts
+    # normalized so far when one of them had it
+    def group_verdict(self, group):
+        verdict = self.group_flags.get(group)
+        if verdict is None:
+            verdict = self.flags(group) if self.flags is not None else (False, False)
+        return verdict
+
+    # Merges the hosts computed by every process into the table file
+    def save(self):
+        if self.table is not None:
+            return self.table.save(self.compute)
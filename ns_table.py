@@ -0,0 +1,273 @@
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+from config import NS_TABLE_FILE
+from ns_normalizer import verdict_version
+
+MAGIC = b"NSVT"
+VERSION = 1
+# magic, version, key (hash of the analyzer and rule files), slot count, name count
+HEADER = struct.Struct("<4sI32sII")
+# Hash slot: key offset in the string pool, registrable domain and group name
+# ids, key length, flags
+SLOT = struct.Struct("<IIIHBx")
+# Name: offset in the string pool, length
+NAME = struct.Struct("<IH2x")
+USED, BAD, EXPIRED = 1, 2, 4
+
+logger = logging.getLogger(__name__)
+
+
+# Function to get the table key of an analyzer's verdicts: a hash of its
+# name, of the version of the code computing them and of the rule files' digest
+def table_key(name, version, digest):
+    key = f"{name}/{version}/{digest}"
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest().encode("ascii")
+
+
+# Function to encode a host as a table key, None when it cannot be stored
+def encode_host(host):
+    try:
+        key = host.encode("utf-8")
+    except UnicodeEncodeError:
+        return None
+    if len(key) > 0xFFFF or b"\t" in key or b"\n" in key:
+        return None
+    return key
+
+
+# Function to write a table file: an open addressing hash table of the hosts
+# (CRC32, linear probing) followed by the names and a pool of their strings.
+# `entries` maps hosts to (registrable domain, group, bad, expired).
+# The file is written aside and moved into place, so readers that mapped
+# the previous one keep reading it.
+def write_table(path, key, entries):
+    names = {}
+    pool = bytearray()
+    name_records = bytearray()
+
+    def name_id(name):
+        i = names.get(name)
+        if i is None:
+            data = name.encode("utf-8")
+            i = names[name] = len(names)
+            name_records.extend(NAME.pack(len(pool), len(data)))
+            pool.extend(data)
+        return i
+
+    size = 8
+    while size < 2 * len(entries):
+        size *= 2
+    mask = size - 1
+    slots = bytearray(SLOT.size * size)
+    for host, (tld, group, bad, expired) in entries.items():
+        data = host.encode("utf-8")
+        slot = zlib.crc32(data) & mask
+        while slots[slot * SLOT.size + SLOT.size - 2] & USED:
+            slot = (slot + 1) & mask
+        flags = USED | (BAD if bad else 0) | (EXPIRED if expired else 0)
+        tld_id, group_id = name_id(tld), name_id(group)
+        SLOT.pack_into(slots, slot * SLOT.size, len(pool), tld_id, group_id, len(data), flags)
+        pool.extend(data)
+
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, key, size, len(names)))
+        f.write(slots)
+        f.write(name_records)
+        f.write(pool)
+    os.replace(temp_path, path)
+
+
+# Read-only view of a table file, memory-mapped so that every process
+# reading it shares the same pages
+class TableFile:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.key, self.size, self.name_count = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.map.close()
+            raise ValueError(f"{path} is not a nameserver table")
+        self.mask = self.size - 1
+        self.names_offset = HEADER.size + SLOT.size * self.size
+        self.pool_offset = self.names_offset + NAME.size * self.name_count
+
+    def name(self, name_id):
+        offset, length = NAME.unpack_from(self.map, self.names_offset + name_id * NAME.size)
+        start = self.pool_offset + offset
+        return self.map[start:start + length].decode("utf-8")
+
+    def _verdict(self, tld_id, group_id, flags):
+        return self.name(tld_id), self.name(group_id), bool(flags & BAD), bool(flags & EXPIRED)
+
+    def get(self, key):
+        data = self.map
+        slot = zlib.crc32(key) & self.mask
+        while True:
+            offset, tld_id, group_id, length, flags = SLOT.unpack_from(data, HEADER.size + slot * SLOT.size)
+            if not flags & USED:
+                return None
+            start = self.pool_offset + offset
+            if length == len(key) and data[start:start + length] == key:
+                return self._verdict(tld_id, group_id, flags)
+            slot = (slot + 1) & self.mask
+
+    # Returns every (host, verdict) of the table
+    def items(self):
+        for slot in range(self.size):
+            offset, tld_id, group_id, length, flags = SLOT.unpack_from(self.map, HEADER.size + slot * SLOT.size)
+            if flags & USED:
+                start = self.pool_offset + offset
+                host = self.map[start:start + length].decode("utf-8")
+                yield host, self._verdict(tld_id, group_id, flags)
+
+    def close(self):
+        self.map.close()
+
+
+# On-disk table of nameserver host verdicts (registrable domain, group, bad
+# flag, expired flag) of an analyzer, shared by runs and analysis processes.
+# The verdicts are a pure function of the host, the code and the rule
+# files, so the table is keyed by a hash of their versions: a table written
+# for other rule files or another version is ignored, and rebuilt by save().
+# Lookups read the memory-mapped table file; hosts it does not have yet are
+# appended by add() to <file>.delta, one line per host in a single write,
+# which every process can do at the same time. save() merges the delta into
+# a new table file, at the end of a run.
+class NsVerdictTable:
+    def __init__(self, path, key):
+        self.path = path
+        self.key = key
+        self.delta_path = f"{path}.delta"
+        self._file = None
+        self._opened = False
+        self._delta = None
+        self._lock = threading.Lock()
+
+    def _table(self):
+        if not self._opened:
+            with self._lock:
+                if not self._opened:
+                    try:
+                        table = TableFile(self.path)
+                    except (OSError, ValueError):
+                        table = None
+                    if table is not None and table.key != self.key:
+                        table.close()
+                        table = None
+                    self._file = table
+                    self._opened = True
+        return self._file
+
+    # Returns the verdict of a host, None when it is not in the table
+    def get(self, host):
+        table = self._table()
+        if table is None:
+            return None
+        key = encode_host(host)
+        return table.get(key) if key is not None else None
+
+    def add(self, host, verdict):
+        if encode_host(host) is None:
+            return
+        tld, group, bad, expired = verdict
+        line = f"{self.key.decode('ascii')}\t{host}\t{tld}\t{group}\t{int(bad)}\t{int(expired)}\n"
+        with self._lock:
+            if self._delta is None:
+                self._delta = os.open(self.delta_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            os.write(self._delta, line.encode("utf-8"))
+
+    # Merges the delta into the table file. Verdicts of other rule files
+    # (the table of a previous version of the files, delta lines written
+    # before they changed) are computed again with `compute(host)`.
+    # Returns the number of hosts in the new table, None when unchanged.
+    def save(self, compute):
+        with self._lock:
+            if self._delta is not None:
+                os.close(self._delta)
+                self._delta = None
+        merging = f"{self.delta_path}.{os.getpid()}.merging"
+        try:
+            os.replace(self.delta_path, merging)
+        except FileNotFoundError:
+            merging = None
+
+        entries = {}
+        stale = []
+        try:
+            table = TableFile(self.path)
+        except (OSError, ValueError):
+            table = None
+        if table is not None:
+            if table.key == self.key:
+                entries.update(table.items())
+            else:
+                stale.extend(host for host, _ in table.items())
+            table.close()
+        if merging is None and not stale:
+            return None
+
+        if merging is not None:
+            with open(merging, "r", encoding="utf-8") as f:
+                for line in f:
+                    fields = line.rstrip("\n").split("\t")
+                    if len(fields) != 6:
+                        continue  # Line cut short by an interrupted write
+                    key, host, tld, group, bad, expired = fields
+                    if key == self.key.decode("ascii"):
+                        entries[host] = (tld, group, bad == "1", expired == "1")
+                    else:
+                        stale.append(host)
+        for host in stale:
+            if host not in entries:
+                entries[host] = compute(host)
+
+        # The file cannot be replaced while this process maps it on Windows
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+            self._file = None
+            self._opened = False
+        try:
+            write_table(self.path, self.key, entries)
+        except OSError as e:
+            # e.g. the file is mapped by an analysis process still running
+            # on Windows: the delta is kept for the next run
+            logger.warning("Could not update %s: %s", self.path, e)
+            if merging is not None:
+                with open(merging, "rb") as f, open(self.delta_path, "ab") as delta:
+                    delta.write(f.read())
+                os.remove(merging)
+            return None
+        if merging is not None:
+            os.remove(merging)
+        return len(entries)
+
+    def close(self):
+        with self._lock:
+            if self._delta is not None:
+                os.close(self._delta)
+                self._delta = None
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+# Function to open the verdict table of analyzer `name` for the rule files
+# of `config` (an AnalyzerConfig), None when NS_TABLE_FILE is disabled.
+# `version` is the analyzer's VERDICT_VERSION, as its flags are part of the
+# verdicts; the table is also rebuilt when the normalization changes (see
+# ns_normalizer.verdict_version).
+# Each analyzer has its own file: ns_table.bin becomes ns_table.<name>.bin.
+def open_ns_table(name, config, version):
+    if not NS_TABLE_FILE:
+        return None
+    base, ext = os.path.splitext(NS_TABLE_FILE)
+    path = os.path.join(os.getcwd(), f"{base}.{name}{ext}")
+    return NsVerdictTable(path, table_key(name, f"{version}/{verdict_version()}", config.digest()))
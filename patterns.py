@@ -0,0 +1,197 @@
+import fnmatch
+import os
+import re
+
+LITERAL_RE = re.compile(r"[A-Za-z0-9._-]+")
+MEMO_LIMIT = 200000
+
+
+# Compiles a list of "*" patterns into one alternation regex.
+# Matching follows the original per-pattern check
+# `re.search(pattern.replace("*", ".*"), ns)`: unanchored and case sensitive.
+# Plain host entries such as "above.com" are also kept in a hash set so an
+# exact hit skips the regex.
+class GlobSearch:
+    def __init__(self, patterns):
+        self.literals = frozenset(p for p in patterns if LITERAL_RE.fullmatch(p))
+        regex = "|".join(f"(?:{p.replace('*', '.*')})" for p in patterns)
+        self.regex = re.compile(regex) if patterns else None
+        self.memo = {}
+
+    def __call__(self, ns):
+        verdict = self.memo.get(ns)
+        if verdict is None:
+            if ns in self.literals:
+                verdict = True
+            else:
+                verdict = self.regex is not None and self.regex.search(ns) is not None
+            if len(self.memo) >= MEMO_LIMIT:
+                self.memo.clear()
+            self.memo[ns] = verdict
+        return verdict
+
+
+# Compiles a list of shell-style patterns with fnmatch.translate into one regex.
+# With `match=True` a name must match a whole pattern like fnmatch.fnmatch;
+# otherwise the pattern only has to match at the end of the text, case
+# insensitively, like the original `re.compile(fnmatch.translate(p), re.I).search`.
+class FnmatchSet:
+    def __init__(self, patterns, match=False):
+        self.match = match
+        if match:
+            patterns = [os.path.normcase(p) for p in patterns]
+        regex = "|".join(f"(?:{fnmatch.translate(p)})" for p in patterns)
+        flags = 0 if match else re.IGNORECASE
+        self.regex = re.compile(regex, flags) if patterns else None
+        self.memo = {}
+
+    def __call__(self, text):
+        verdict = self.memo.get(text)
+        if verdict is None:
+            if self.regex is None:
+                verdict = False
+            elif self.match:
+                verdict = self.regex.match(os.path.normcase(text)) is not None
+            else:
+                verdict = self.regex.search(text) is not None
+            if len(self.memo) >= MEMO_LIMIT:
+                self.memo.clear()
+            self.memo[text] = verdict
+        return verdict
+
+
+# Nameserver classifier built once from the bad.txt and expired.txt patterns.
+# Every check compiles to a single regex plus a memo of per-nameserver
+# verdicts, so repeated nameservers cost a dictionary lookup.
+class PatternSet:
+    def __init__(self, bad_patterns, expired_patterns):
+        self.bad_patterns = list(bad_patterns)
+        self.expired_patterns = list(expired_patterns)
+        self.bad_entries = frozenset(self.bad_patterns)
+        self.is_bad = GlobSearch(self.bad_patterns)
+        self.is_expired = GlobSearch(self.expired_patterns)
+        self.contains_expired = FnmatchSet(self.expired_patterns)
+        self.expired_in_sub_domain = FnmatchSet(self.expired_patterns, match=True)
+
+    # Exact bad.txt entry, as used by the ns_checker logic
+    def in_bad_list(self, ns):
+        return ns in self.bad_entries
+
+    def is_bad_or_expired(self, ns):
+        return self.is_bad(ns) or self.is_expired(ns)
+
+
+# Regex prefix matching the labels a parent domain drops from a host
+PARENT_PREFIX = r"(?:.*\.)?"
+
+
+# A node of the same.txt trie: children by literal label, the exact entry
+# made of the labels so far, and the suffix and glob entries whose literal
+# labels end here
+class LabelNode:
+    __slots__ = ("children", "exact", "suffixes", "globs", "any_glob")
+
+    def __init__(self):
+        self.children = {}
+        self.exact = None
+        self.suffixes = []
+        self.globs = []
+        self.any_glob = None
+
+
+# The same.txt groups: {nameserver: main nameserver} like the file has
+# always been read, indexed in a trie of reversed labels.
+#   exact  - "awsdns.com", matching the registrable domain of a host
+#   suffix - "*.example.com", any subdomain of example.com
+#   glob   - any other entry with *, ? or [...], e.g. "*.awsdns-*"; "*"
+#            also matches dots
+# Wildcard entries match a host or one of its parent domains. An entry is
+# stored under its trailing literal labels ("example.com" for "example.com",
+# "*.example.com" and "ns?.example.com"), so a lookup walks the host's
+# labels once and only tries the entries found on the way. The longest
+# match wins, exact or not: most trailing literal labels first, then the
+# most literal characters, then the first entry in the file; so
+# "*.foo.example.com" wins over "example.com" for its hosts. The globs
+# stored under the same labels are also joined into one regex, so a host
+# matching none of them costs one check.
+class SameGroups(dict):
+    def __init__(self, groups=()):
+        super().__init__(groups)
+        self.root = LabelNode()
+        self.wildcards = 0
+        for order, (entry, main) in enumerate(self.items()):
+            self._add(entry, main, order)
+        nodes = [self.root]
+        while nodes:
+            node = nodes.pop()
+            nodes.extend(node.children.values())
+            if node.globs:
+                rests = "|".join(regex.pattern[len(PARENT_PREFIX):] for _, _, regex in node.globs)
+                node.any_glob = re.compile(f"{PARENT_PREFIX}(?:{rests})", re.S)
+
+    def _add(self, entry, main, order):
+        labels = entry.split(".")
+        if not any(c in entry for c in "*?["):
+            node = self.root
+            for label in reversed(labels):
+                node = node.children.setdefault(label, LabelNode())
+            node.exact = ((len(labels), len(entry), -order), main)
+            return
+
+        node = self.root
+        depth = 0
+        while depth < len(labels) - 1 and not any(c in labels[-1 - depth] for c in "*?["):
+            node = node.children.setdefault(labels[-1 - depth], LabelNode())
+            depth += 1
+        rest = ".".join(labels[: len(labels) - depth])
+        literal = len(entry) - entry.count("*") - entry.count("?")
+        rank = (depth, literal, -order)
+        if rest == "*":
+            node.suffixes.append((rank, main))
+        else:
+            # The rest of the host, or of one of its parent domains, must match
+            regex = re.compile(PARENT_PREFIX + fnmatch.translate(rest), re.S)
+            node.globs.append((rank, main, regex))
+        self.wildcards += 1
+
+    # Returns the exact entry (rank, main NS) of a name, None when it has none
+    def _exact(self, name):
+        node = self.root
+        for label in reversed(name.split(".")):
+            node = node.children.get(label)
+            if node is None:
+                return None
+        return node.exact
+
+    # Returns the main NS of the longest entry matching `host`: the exact
+    # entry of its registrable `domain` (the host itself by default) or a
+    # wildcard entry matching the host or one of its parent domains.
+    # None when no entry matches.
+    def match(self, host, domain=None):
+        if domain is None:
+            domain = host
+        if not self.wildcards:
+            return self.get(domain)
+        best = self._exact(domain)
+        labels = host.split(".")
+        count = len(labels)
+        node = self.root
+        depth = 0
+        end = len(host)  # The host without the labels walked so far
+        while node is not None and depth < count:
+            for rank, main in node.suffixes:
+                if best is None or rank > best[0]:
+                    best = (rank, main)
+            if node.any_glob is not None and node.any_glob.match(host, 0, end):
+                for rank, main, regex in node.globs:
+                    if (best is None or rank > best[0]) and regex.match(host, 0, end):
+                        best = (rank, main)
+            label = labels[count - 1 - depth]
+            node = node.children.get(label)
+            end -= len(label) + 1
+            depth += 1
+        return best[1] if best is not None else None
+
+    # Returns the main NS of a nameserver, None when no entry matches it
+    def lookup(self, ns):
+        return self.match(ns)
@@ -0,0 +1,152 @@
+import atexit
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+
+from config import RATE_LIMIT, RATE_BURST, DAILY_QUOTA, QUOTA_STATE_FILE
+
+MIN_RATE_FRACTION = 0.05  # The adaptive rate never drops below this share of the limit
+RECOVERY_STEP = 0.02      # Share of the limit regained after each successful request
+SAVE_EVERY = 25           # Quota usage is written to disk after this many requests
+
+logger = logging.getLogger(__name__)
+
+
+# Function to get the current quota day (the API quota resets at UTC midnight)
+def quota_day():
+    return datetime.datetime.now(datetime.timezone.utc).date()
+
+
+# Function to get the number of seconds left in the current quota day
+def seconds_left_in_day():
+    now = datetime.datetime.now(datetime.timezone.utc)
+    midnight = datetime.datetime.combine(
+        now.date() + datetime.timedelta(days=1), datetime.time(), datetime.timezone.utc
+    )
+    return max(1.0, (midnight - now).total_seconds())
+
+
+# Token bucket in front of the CompleteDNS API.
+# Requests are admitted at up to `rate` per second with bursts of `burst`.
+# A 429 response halves the current rate and successes slowly bring it back
+# to the configured limit. With a daily quota the requests used today are
+# kept in `state_file`, and when a batch needs more requests than the quota
+# has left, the remaining quota is spread evenly over the rest of the day.
+# Once the quota is used up, callers wait for the next quota day.
+class RateLimiter:
+    def __init__(self, rate=RATE_LIMIT, burst=RATE_BURST, daily_quota=DAILY_QUOTA, state_file=None):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.daily_quota = daily_quota
+        self.state_file = state_file
+        self.day = quota_day()
+        self.used = 0
+        self.pending = 0
+        self.unsaved = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not self.state_file or not os.path.exists(self.state_file):
+            return
+        with open(self.state_file, "r") as f:
+            state = json.load(f)
+        if state.get("day") == self.day.isoformat():
+            self.used = state.get("used", 0)
+
+    def save(self):
+        if not self.state_file or not self.daily_quota:
+            return
+        with self._lock:
+            state = {"day": self.day.isoformat(), "used": self.used}
+            self.unsaved = 0
+        with open(self.state_file, "w") as f:
+            json.dump(state, f)
+
+    # Tell the limiter how many requests the batch is expected to need
+    def plan(self, requests_needed):
+        with self._lock:
+            self.pending = requests_needed
+
+    def _quota_rate(self):
+        remaining = self.daily_quota - self.used
+        if self.pending <= remaining:
+            return None
+        return remaining / seconds_left_in_day()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                today = quota_day()
+                if today != self.day:
+                    self.day, self.used = today, 0
+                if self.daily_quota and self.used >= self.daily_quota:
+                    wait = seconds_left_in_day()
+                    logger.warning("Daily quota of %s requests used, waiting %.0fs", self.daily_quota, wait)
+                else:
+                    rate = self.rate
+                    if self.daily_quota:
+                        quota_rate = self._quota_rate()
+                        if quota_rate is not None:
+                            rate = min(rate, quota_rate) if rate else quota_rate
+                    now = time.monotonic()
+                    if rate:
+                        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * rate)
+                    else:
+                        self.tokens = self.capacity
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        self.used += 1
+                        self.pending = max(0, self.pending - 1)
+                        self.unsaved += 1
+                        save = self.unsaved >= SAVE_EVERY
+                        break
+                    wait = (1 - self.tokens) / rate
+            time.sleep(wait)
+        if save:
+            self.save()
+
+    # Called after a 429 response: halve the rate and drain the bucket
+    def throttled(self):
+        if not self.max_rate:
+            return
+        with self._lock:
+            self.rate = max(self.max_rate * MIN_RATE_FRACTION, self.rate / 2)
+            self.tokens = 0.0
+        logger.debug("Rate limited by the API, slowing down to %.2f req/s", self.rate)
+
+    # Called after any other response: recover towards the configured rate
+    def succeeded(self):
+        if not self.max_rate or self.rate >= self.max_rate:
+            return
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * RECOVERY_STEP)
+
+
+_default_limiter = None
+_default_limiter_lock = threading.Lock()
+
+
+# Function to get the limiter configured in config.py, shared by all threads
+def get_rate_limiter():
+    global _default_limiter
+    with _default_limiter_lock:
+        if _default_limiter is None:
+            state_file = os.path.join(os.getcwd(), QUOTA_STATE_FILE) if QUOTA_STATE_FILE else None
+            _default_limiter = RateLimiter(state_file=state_file)
+            atexit.register(_default_limiter.save)
+    return _default_limiter
+
+
+# Function to replace the shared limiter, e.g. with an unlimited one for benchmarks
+def set_rate_limiter(limiter):
+    global _default_limiter
+    with _default_limiter_lock:
+        _default_limiter = limiter
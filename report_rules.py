@@ -0,0 +1,373 @@
+import types
+
+from config import EXTRA_FOLDER, NS_CACHE_SIZE, FULL_REPORT, GOOD_REPORT, BAD_REPORT
+from analyzer_config import AnalyzerConfig
+from patterns import PatternSet
+from ns_normalizer import NsNormalizer
+from ns_table import open_ns_table
+from ns_events import NsPeriod, NsSetTable, from_ordinal, parse_day, run_cutoffs
+from report_writer import needed_columns, rules_decided
+from run_metrics import METRICS
+
+# Report rules: scores a domain's nameserver history into the report row
+# (Unique NS Changes, Bad NS, Expired NS, Longest NS, Last NS, ...) that
+# the Good/Bad lists are built from.
+
+EXCLUDE_DAYS = 150
+TAIL_DAYS = 90  # The open last period of a history ends this many days ago
+VERDICT_VERSION = 2  # Bump when a change to the analysis changes its results
+
+# Columns computed from the runs of periods with the same nameservers; the
+# others come from counting the periods
+RUN_COLUMNS = {"Longest NS", "Longest NS Years", "Last NS", "Last NS Date", "Last=Longest?", "Last=Good?"}
+
+
+# Function to compile bad.txt, expired.txt and same.txt into the rules of the analysis
+def build_rules(config):
+    patterns = PatternSet(config.get("bad"), config.get("expired"))
+    same_groups = config.get("same")
+    # Cached nameserver normalization: registrable domain, same.txt group and
+    # the group's bad.txt/expired.txt flags, shared through the verdict table
+    normalizer = NsNormalizer(
+        same_groups,
+        keep_host=patterns.expired_in_sub_domain,
+        flags=lambda group: (patterns.is_bad(group), patterns.is_expired(group)),
+        table=open_ns_table("report", config, VERDICT_VERSION),
+    )
+
+    # Function to map NS to their main NS group
+    def map_group(ns):
+        return same_groups.lookup(ns) or ns
+
+    return types.SimpleNamespace(
+        patterns=patterns,
+        same_groups=same_groups,
+        normalizer=normalizer,
+        map_group=map_group,
+        # Interned NS sets of the analysed histories
+        ns_sets=NsSetTable(patterns, map_group, NS_CACHE_SIZE, normalizer.group_verdict),
+    )
+
+
+# Rule files, loaded on first use and reloaded when they change
+ANALYZER_CONFIG = AnalyzerConfig(build_rules, EXTRA_FOLDER)
+
+
+# Function to map NS to their main NS group
+def map_to_main_ns(ns):
+    return ANALYZER_CONFIG.rules().map_group(ns)
+
+
+def contains_expired_in_sub_domain(ns):
+    return ANALYZER_CONFIG.rules().patterns.expired_in_sub_domain(ns)
+
+
+def extract_tld(ns):
+    return ANALYZER_CONFIG.rules().normalizer.extract_tld(ns)
+
+
+# Function to compute the report columns of a history's periods in one pass.
+# The first period only counts for the good nameservers: those of the
+# periods starting by `good_until`, when `good` is set. The other columns
+# are taken from the periods after it:
+#   changes  - distinct change keys of the periods whose NS is not good
+#   bad      - bad nameservers over all the periods
+#   expired  - distinct end dates of the periods with an expired nameserver;
+#              `tail`, the period closed at the 90 days cut-off, ends at a
+#              moment rather than a day, so it never shares an event's date
+#   longest  - the NS used the longest in a row, and for how many days
+#   last     - the period starting the trailing run of periods with the same
+#              nameservers, None without periods after the first
+# Without `counts` the first four columns are not computed (0 and an empty
+# set are returned for them), without `runs` the last three (None, 0, None).
+# Returns (changes, bad, expired, longest NS, longest days, last, good NS set).
+def summarise_periods(ns_, good_until, good, tail, tail_end, ns_sets, counts=True, runs=True):
+    first = ns_sets.first
+    members = ns_sets.members
+    good_ns = set()
+    change_keys = {}  # NS -> change keys of its periods
+    bad_count = 0
+    expired_dates = set()
+    longest_ns = None
+    longest_days = 0
+    current_ns = None
+    run_days = 0
+    last = None
+    count = len(ns_)
+    for i in range(count):
+        period = ns_[i]
+        ns_id = period.ns_id
+        ns = first[ns_id]
+        if counts:
+            if good and period.start <= good_until:
+                good_ns.add(ns)
+            if i == 0:
+                continue
+
+            keys = change_keys.get(ns)
+            if keys is None:
+                keys = change_keys[ns] = set()
+            keys.add(ns_sets.change_key[ns_id])
+            bad_count += ns_sets.bad_count[ns_id]
+            if ns_sets.has_expired[ns_id]:
+                expired_dates.add(period.end if period is not tail else None)
+        if not runs or i == 0:
+            continue
+
+        # Consecutive periods of the same NS add up; an open period ends
+        # where the next one starts, the last one at the tail cut-off
+        if period.end is not None:
+            end = period.end
+        elif i + 1 < count:
+            end = ns_[i + 1].start
+        else:
+            end = tail_end
+        if current_ns is None:
+            current_ns = ns
+        if not (current_ns and current_ns == ns):
+            run_days = 0
+        run_days = end - period.start + run_days
+        if run_days > longest_days:
+            longest_days = run_days
+            longest_ns = ns
+        current_ns = ns
+
+        if i == 1 or members[ns_id] != members[ns_[i - 1].ns_id]:
+            last = period
+
+    changes = set()
+    for ns, keys in change_keys.items():
+        if ns not in good_ns:
+            changes |= keys
+    changes.discard(None)
+    return len(changes), bad_count, len(expired_dates), longest_ns, longest_days, last, good_ns
+
+
+def check_ns_condition(start_ordinal, end_ordinal, ns_id, ns_sets):
+    pop = False
+    expired = False
+    bad = False
+    date_start = from_ordinal(start_ordinal)
+    date_end = from_ordinal(end_ordinal)
+    total_months1 = date_start.year * 12 + date_start.month
+    total_months2 = date_end.year * 12 + date_end.month
+    month_diff = abs(total_months2 - total_months1)
+    if month_diff == 4:
+        if date_end.day <= date_start.day:
+            if not ns_sets.no_expired_substring[ns_id]:
+                expired = True
+            bad = ns_sets.has_bad[ns_id]
+            pop = True
+    elif month_diff < 4:
+        if not ns_sets.no_expired_substring[ns_id]:
+            expired = True
+        bad = ns_sets.has_bad[ns_id]
+        pop = True
+    return pop, expired, bad
+
+
+# Function to score a domain's history into its report row.
+# The Longest NS and Last NS columns are only computed when the enabled
+# outputs need them: always for the full report, and for the Good/Bad lists
+# alone only when their rules are not already decided by the other columns
+# (see report_writer.rules_decided). Skipped columns are None.
+def process_ns_history(data, current_date, full_report=1, good_report=1, bad_report=1):
+    if "error_type" in data or "error" in data:
+        return {"error": data["error_msg"]}
+    # print('.'*15, data)
+    domain = data["domain"]
+    filtered_events = data.get("events", [])
+
+    if not filtered_events:
+        return {"Unique NS Changes": 0}
+
+    rules = ANALYZER_CONFIG.rules()
+    ns_sets = rules.ns_sets
+    ns_sets.trim()
+    # Every cut-off is taken from the run clock, so re-runs are reproducible
+    ns_end_limit, tail_end = run_cutoffs(current_date, EXCLUDE_DAYS, TAIL_DAYS)
+    extra_expired = 0
+    extra_bad = 0
+    ns_ = []
+    need_end_date = False
+    last_ns=''
+    last_ns_date = None
+    ns_changes_count = 0
+    expired_ns_count = 0
+    bad_ns_count = 0
+    longest_duration=0.0
+    last_is_longest = None
+    last_is_good = None
+    event_count=0
+    ns_lookups = 0
+    longest_ns=''
+    # The last nameserver of the last period added; the good NS check below
+    # has always been made against it
+    last_seen_ns = None
+    runs = True
+    for event in filtered_events:
+        event_count+=1
+        # -----------------------------------------------
+        event_date = event.get("date")
+        if event_date.get("date"):
+            date_start = parse_day(event_date.get("date"))
+            date_end = date_start
+        else:
+            date_start = parse_day(event_date.get("date_start"))
+            date_end = parse_day(event_date.get("date_end"))
+
+        if need_end_date and ns_:
+            if ns_[-1].end is None:
+                ns_[-1].end = date_end
+                pop, expired, bad = check_ns_condition(ns_[-1].start, ns_[-1].end, ns_[-1].ns_id, ns_sets)
+                if pop:
+                    ns_.pop()
+                    need_end_date = False
+                if expired:
+                    extra_expired += 1
+                if bad:
+                    extra_bad += 1
+        if date_start <= ns_end_limit:
+            if event.get('type')=='dropped':
+                continue
+            # Only the events before the cut-off are normalized; the ones
+            # after it are never decoded from a lazily decoded history
+            ns_set = {rules.normalizer.group(ns) for ns in event["nameservers"]}
+            ns_lookups += len(event["nameservers"])
+            if ns_set:
+                ns_id = ns_sets.intern(ns_set)
+                ns_.append(NsPeriod(ns_id, date_start))
+                need_end_date = True
+                last_ns_date = date_end
+                last_seen_ns = ns_sets.last[ns_id]
+        else:
+            break
+            # -----------------------------------------------
+
+    METRICS.inc("ns_lookups", ns_lookups)
+    tail = None
+    if need_end_date and ns_:
+        tail = ns_[-1]
+        tail.end = tail_end
+        pop, expired, bad = check_ns_condition(ns_[-1].start, ns_[-1].end, ns_[-1].ns_id, ns_sets)
+        if pop:
+            ns_.pop()
+        if expired:
+            extra_expired += 1
+        if bad:
+            extra_bad += 1
+    if ns_:
+        first_ns_date = ns_[0].start
+        current_year = current_date.year
+        first_ns_year = from_ordinal(first_ns_date).year
+        period_years = 3 if current_year - first_ns_year >= 8 else .83333333
+        period_end_date = first_ns_date + 365 * period_years
+
+        good = not rules.patterns.is_bad_or_expired(last_seen_ns)
+        runs = bool(needed_columns(full_report, good_report, bad_report) & RUN_COLUMNS)
+        if full_report or not runs:
+            changes, bad, expired, longest, longest_days, last, good_ns = summarise_periods(
+                ns_, period_end_date, good, tail, tail_end, ns_sets, runs=runs
+            )
+        else:
+            # Only the Good/Bad rules read the run columns: count the periods
+            # first, and look for the runs only when the rules need them
+            changes, bad, expired, _, _, _, good_ns = summarise_periods(
+                ns_, period_end_date, good, tail, tail_end, ns_sets, runs=False
+            )
+            counts = {"Unique NS Changes": changes}
+            if len(ns_) > 1:
+                counts["Bad NS"] = bad + extra_bad
+                counts["Expired NS"] = expired + extra_expired
+            runs = not rules_decided(counts, good_report, bad_report)
+            if runs:
+                _, _, _, longest, longest_days, last, _ = summarise_periods(
+                    ns_, period_end_date, good, tail, tail_end, ns_sets, counts=False
+                )
+        ns_changes_count = changes
+        if len(ns_) > 1:
+            bad_ns_count = bad + extra_bad
+            expired_ns_count = expired + extra_expired
+        if not runs:
+            last_ns = last_ns_date = None
+        elif last is not None:
+            longest_ns = longest
+            longest_duration = round(longest_days / 365.0, 1)
+            if last is not ns_[-1]:
+                last_ns_date = last.end
+            last_ns = ns_sets.first[last.ns_id]
+
+            last_is_longest = "Yes" if last_ns == longest_ns else "No"
+
+            last_is_good = "Yes" if last_ns in good_ns else "No"
+        else:
+            last_ns_date = None
+    if not runs:
+        return {
+            "Unique NS Changes": ns_changes_count,
+            "Bad NS": bad_ns_count,
+            "Expired NS": expired_ns_count,
+            **dict.fromkeys(RUN_COLUMNS),
+        }
+    return {
+        "Unique NS Changes": ns_changes_count,
+        "Bad NS": bad_ns_count,
+        "Expired NS": expired_ns_count,
+        "Longest NS": f"{longest_ns} | {round(longest_duration, 1)}y",
+        "Longest NS Years": round(longest_duration, 1),
+        "Last NS": last_ns,
+        "Last NS Date": from_ordinal(last_ns_date).strftime("%Y-%m-%d") if last_ns_date else None,
+        "Last=Longest?": last_is_longest if last_is_longest else None,
+        "Last=Good?": last_is_good if last_is_good else None,
+    }
+
+
+# Rule engine entry point: what a report row depends on besides the history
+# itself, i.e. the rule files, the cut-offs of the run clock and, without
+# the full report, the enabled lists (which decide the columns computed)
+def verdict_key(current_date):
+    ns_end_limit, tail_end = run_cutoffs(current_date, EXCLUDE_DAYS, TAIL_DAYS)
+    outputs = "" if FULL_REPORT else f"/lists-{GOOD_REPORT:d}{BAD_REPORT:d}"
+    return (
+        f"report/{VERDICT_VERSION}/{ANALYZER_CONFIG.digest()}/"
+        f"{ns_end_limit}/{tail_end}/{current_date.year}{outputs}"
+    )
+
+
+# Rule engine entry point: merges the nameserver verdicts computed during the
+# run, by this process and the analysis workers, into the shared table
+def save_ns_table():
+    return ANALYZER_CONFIG.rules().normalizer.save()
+
+
+# Rule engine entry point: adds the report row of a fetched history to the
+# domain's record, with whether the analysis succeeded and its error line.
+# Only the columns FULL_REPORT, GOOD_REPORT and BAD_REPORT need are computed.
+def analyse_domain(record, data, current_date):
+    domain = record["domain"]
+    result = process_ns_history(data, current_date, FULL_REPORT, GOOD_REPORT, BAD_REPORT)
+    if "error" in result:
+        record["errors"].append(f"Domain: {domain} - Error: {result['error']}")
+        new_item = {
+            "Domain": domain,
+        }
+        conclusion_item = {"Conclusion": ""}
+        default_value = {
+                            "Unique NS Changes": None,
+                            "Bad NS": None,
+                            "Expired NS": None,
+                            "Longest NS": '',
+                            "Longest NS Years": None,
+                            "Last NS": None,
+                            "Last NS Date": None,
+                            "Last=Longest?": None,
+                            "Last=Good?": None,
+                        }
+        record["row"] = {**new_item, **default_value, **conclusion_item}
+    else:
+        new_item = {
+            "Domain": domain,
+        }
+        conclusion_item = {"Conclusion": ""}
+        record["row"] = {**new_item, **result, **conclusion_item}
+        record["ok"] = True
@@ -0,0 +1,241 @@
+import collections
+import csv
+import os
+
+from config import FULL_REPORT, GOOD_REPORT, BAD_REPORT, FLAGGED_SEEN_SIZE
+
+REPORT_COLUMNS = [
+    "Domain",
+    "Unique NS Changes",
+    "Bad NS",
+    "Expired NS",
+    "Longest NS",
+    "Last NS",
+    "Last NS Date",
+    "Last=Longest?",
+    "Last=Good?",
+    "Conclusion",
+]
+
+
+# Function to compare a report value that may be missing (None) against a bound
+def at_least(value, bound):
+    return value is not None and value >= bound
+
+
+# Function to get a row's Longest NS duration in years.
+# Rows journaled before the numeric column existed only have the
+# "ns | 4.2y" text, which is parsed instead.
+def longest_years(row):
+    years = row.get("Longest NS Years")
+    if years is None and row.get("Longest NS"):
+        years = float(row["Longest NS"].split(" | ")[1][:-1])
+    return years
+
+
+# Report columns read by the Good and Bad rules below
+GOOD_RULE_COLUMNS = ("Unique NS Changes", "Last=Good?", "Last=Longest?", "Longest NS", "Longest NS Years")
+BAD_RULE_COLUMNS = ("Bad NS", "Expired NS", "Last=Longest?", "Last=Good?", "Unique NS Changes")
+
+
+# Function to get the report columns the enabled outputs need: all of them
+# for the full report, otherwise those read by the rules of the enabled lists
+def needed_columns(full_report=FULL_REPORT, good_report=GOOD_REPORT, bad_report=BAD_REPORT):
+    if full_report:
+        return set(REPORT_COLUMNS) | {"Longest NS Years"}
+    columns = set()
+    if good_report:
+        columns.update(GOOD_RULE_COLUMNS)
+    if bad_report:
+        columns.update(BAD_RULE_COLUMNS)
+    return columns
+
+
+# Function to tell whether the rules of the enabled lists are decided for a
+# row by its Unique NS Changes, Bad NS and Expired NS alone, so that its
+# Longest NS and Last NS columns are not needed. Mirrors the terms of
+# is_good_row and is_bad_row.
+def rules_decided(row, good_report=GOOD_REPORT, bad_report=BAD_REPORT):
+    if good_report and row.get("Unique NS Changes") != 0:
+        return False
+    if bad_report and not at_least(row.get("Bad NS"), 1) and at_least(row.get("Expired NS"), 1):
+        return False
+    return True
+
+
+# Good rule of the report, applied to a single successful row
+def is_good_row(row):
+    return (
+        row.get("Unique NS Changes") == 0
+        or row.get("Last=Good?") == "Yes"
+        or (
+            row.get("Last=Longest?") == "YES"
+            and bool(row.get("Longest NS"))
+            and at_least(longest_years(row), 4)
+        )
+    )
+
+
+# Bad rule of the report, applied to a single successful row
+def is_bad_row(row):
+    return (
+        at_least(row.get("Bad NS"), 1)
+        or (
+            at_least(row.get("Expired NS"), 2)
+            and row.get("Last=Longest?") == "NO"
+            and row.get("Last=Good?") == "NO"
+        )
+        or (
+            row.get("Expired NS") == 1
+            and row.get("Last=Longest?") == "NO"
+            and row.get("Last=Good?") == "NO"
+            and at_least(row.get("Unique NS Changes"), 4)
+        )
+    )
+
+
+# Good and Bad rules of the report applied to a whole report DataFrame at once.
+# Returns boolean masks (as numpy arrays) restricted to the rows flagged in
+# `success`; missing values never match a rule. The mask of a rule that is
+# not wanted (`good`/`bad` false) is None.
+def classify_frame(df, success, good=True, bad=True):
+    import pandas as pd
+
+    changes = df["Unique NS Changes"]
+    last_is_longest = df["Last=Longest?"]
+    last_is_good = df["Last=Good?"]
+    good_mask = bad_mask = None
+
+    if good:
+        years = pd.to_numeric(df["Longest NS Years"], errors="coerce")
+        if years.isna().any():
+            parsed = df["Longest NS"].astype("string").str.extract(r"\| (-?[\d.]+)y$", expand=False)
+            years = years.fillna(pd.to_numeric(parsed, errors="coerce"))
+        good_mask = (
+            (changes == 0)
+            | (last_is_good == "Yes")
+            | ((last_is_longest == "YES") & (years >= 4))
+        ).to_numpy(dtype=bool) & success
+    if bad:
+        expired = df["Expired NS"]
+        bad_mask = (
+            (df["Bad NS"] >= 1)
+            | ((expired >= 2) & (last_is_longest == "NO") & (last_is_good == "NO"))
+            | (
+                (expired == 1)
+                & (last_is_longest == "NO")
+                & (last_is_good == "NO")
+                & (changes >= 4)
+            )
+        ).to_numpy(dtype=bool) & success
+    return good_mask, bad_mask
+
+
+# Function to compute the Conclusion column from the Good/Bad masks.
+# A domain is "Bad" when any of its rows matched the Bad rule, otherwise
+# "Good" when any matched the Good rule, like the per-domain labelling of
+# the original report.
+def conclusions(df, good_mask, bad_mask):
+    import numpy as np
+
+    domains = df["Domain"]
+    is_bad = domains.isin(domains[bad_mask]).to_numpy()
+    is_good = domains.isin(domains[good_mask]).to_numpy()
+    return np.select([is_bad, is_good], ["Bad", "Good"], default="")
+
+
+# Writes the report CSV, the Good/Bad lists, the error lines and (for the
+# BAD list logic) the flagged domains one domain at a time, as journal
+# records come in. Every file is flushed after each domain, so the outputs
+# can be followed while the run is going and memory does not grow with the
+# number of domains. Pass None for an output to disable it; a rule is only
+# applied when its list or the report is written.
+# A domain repeated in the input is written to the flagged file once when
+# it is among the last `flagged_seen_size` flagged domains.
+class StreamingReport:
+    def __init__(
+        self,
+        report_file=None,
+        good_file=None,
+        bad_file=None,
+        error_file=None,
+        flagged_file=None,
+        flagged_seen_size=FLAGGED_SEEN_SIZE,
+    ):
+        self.rows = 0
+        self.good = 0
+        self.bad = 0
+        self.errors = 0
+        self.flagged = 0
+        self._flagged_seen = collections.OrderedDict()
+        self._flagged_seen_size = flagged_seen_size
+        self._error_file = error_file
+        self._errors = None
+        self._report = None
+        self._report_file = None
+        if report_file:
+            self._report_file = open(report_file, "w", newline="", encoding="utf-8")
+            self._report = csv.DictWriter(
+                self._report_file,
+                REPORT_COLUMNS,
+                restval="",
+                extrasaction="ignore",
+                lineterminator=os.linesep,
+            )
+            self._report.writeheader()
+        self._good = open(good_file, "w", encoding="utf-8") if good_file else None
+        self._bad = open(bad_file, "w", encoding="utf-8") if bad_file else None
+        self._flagged = open(flagged_file, "w", encoding="utf-8") if flagged_file else None
+
+    def add(self, record):
+        row = record["row"]
+        if row is not None:
+            self.rows += 1
+            if record["ok"]:
+                good = (self._good is not None or self._report is not None) and is_good_row(row)
+                bad = (self._bad is not None or self._report is not None) and is_bad_row(row)
+                if good:
+                    self.good += 1
+                    self._write_line(self._good, row["Domain"])
+                if bad:
+                    self.bad += 1
+                    self._write_line(self._bad, row["Domain"])
+                if good or bad:
+                    row = {**row, "Conclusion": "Bad" if bad else "Good"}
+            if self._report is not None:
+                self._report.writerow(row)
+                self._report_file.flush()
+
+        for error in record["errors"]:
+            self.errors += 1
+            if self._error_file:
+                if self._errors is None:
+                    self._errors = open(self._error_file, "w", encoding="utf-8")
+                self._write_line(self._errors, error)
+
+        if record.get("bad"):
+            domain = record["domain"]
+            if domain in self._flagged_seen:
+                self._flagged_seen.move_to_end(domain)
+            else:
+                self._flagged_seen[domain] = True
+                if len(self._flagged_seen) > self._flagged_seen_size:
+                    self._flagged_seen.popitem(last=False)
+                self.flagged += 1
+                self._write_line(self._flagged, domain)
+
+    def _write_line(self, f, line):
+        if f is not None:
+            f.write(line + "\n")
+            f.flush()
+
+    def summary(self):
+        return (
+            f"Rows: {self.rows}, Good: {self.good}, Bad: {self.bad}, "
+            f"Errors: {self.errors}"
+        )
+
+    def close(self):
+        for f in (self._report_file, self._good, self._bad, self._errors, self._flagged):
+            if f is not None:
+                f.close()
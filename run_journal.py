@@ -0,0 +1,67 @@
+import json
+import os
+
+from config import JOURNAL_SYNC_EVERY
+
+
+# Append-only JSON lines file with one record per processed domain.
+# Each record is flushed as soon as it is written and fsync'ed every
+# JOURNAL_SYNC_EVERY records, so an interrupted run can be resumed from the
+# last processed domain. A new run truncates the journal; a resumed run
+# counts the records of the previous runs in `count` and keeps appending.
+# The journaled records are read back one at a time by records(), in the
+# order they were written, so no record is kept in memory.
+class RunJournal:
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.count = 0
+        torn = False
+        if resume and os.path.exists(path):
+            torn = self._load()
+        self._file = open(path, "a" if resume else "w", encoding="utf-8")
+        if torn:
+            self._file.write("\n")
+        self._unsynced = 0
+
+    # Returns True when the file ends in a partially written line
+    def _load(self):
+        line = "\n"
+        for line, record in self._read():
+            if record is not None:
+                self.count += 1
+        return not line.endswith("\n")
+
+    def _read(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn last line from an interrupted write
+                    record = None
+                yield line, record
+
+    # Returns the records journaled before this run, in journal order
+    def records(self):
+        left = self.count
+        if not left:
+            return
+        for _, record in self._read():
+            if record is not None:
+                yield record
+                left -= 1
+                if not left:
+                    return
+
+    def append(self, record):
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        self._unsynced += 1
+        if self._unsynced >= JOURNAL_SYNC_EVERY:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+    def close(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
@@ -0,0 +1,291 @@
+import bisect
+import contextlib
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+
+from config import METRICS_INTERVAL, METRICS_FILE
+
+# Upper bounds (seconds) of the latency histogram buckets: 10us to ~84s
+BUCKETS = tuple(0.00001 * 2 ** i for i in range(24))
+
+logger = logging.getLogger(__name__)
+
+
+# Latency histogram with fixed exponential buckets. The percentiles are
+# estimated as the upper bound of the bucket they fall in.
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, state):
+        for i, count in enumerate(state["counts"]):
+            self.counts[i] += count
+        self.count += state["count"]
+        self.sum += state["sum"]
+        self.max = max(self.max, state["max"])
+
+    def percentile(self, fraction):
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return BUCKETS[i] if i < len(BUCKETS) else self.max
+        return self.max
+
+    def state(self):
+        return {"counts": list(self.counts), "count": self.count, "sum": self.sum, "max": self.max}
+
+
+# Counters, gauges and latency histograms of a run, shared by all threads.
+# Worker processes send theirs to the parent with take() and merge().
+#   counters   - running totals (domains, cache hits, API retries, ...)
+#   gauges     - current values (requests in flight); the peak of each gauge
+#                is kept as the "<name>_max" gauge
+#   histograms - durations in seconds of each stage
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+        # A forked worker process starts over with a lock of its own: the
+        # parent's threads may hold this one at the fork, and their metrics
+        # are the parent's to report
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._forked)
+
+    def _forked(self):
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def reset(self):
+        with self._lock:
+            self._clear()
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_gauge(self, name, delta):
+        with self._lock:
+            value = self.gauges.get(name, 0) + delta
+            self.gauges[name] = value
+            peak = f"{name}_max"
+            if value > self.gauges.get(peak, 0):
+                self.gauges[peak] = value
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    # Returns a context manager recording the duration of its block in `name`
+    def timer(self, name):
+        return StageTimer(self, name)
+
+    # Context manager counting its block in the `name` gauge while it runs
+    @contextlib.contextmanager
+    def tracking(self, name):
+        self.add_gauge(name, 1)
+        try:
+            yield
+        finally:
+            self.add_gauge(name, -1)
+
+    def counter(self, name):
+        return self.counters.get(name, 0)
+
+    def histogram(self, name):
+        return self.histograms.get(name) or Histogram()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "histograms": {name: h.state() for name, h in self.histograms.items()},
+            }
+
+    # Returns the metrics recorded since the last call and starts over
+    def take(self):
+        snapshot = self.snapshot()
+        self.reset()
+        return snapshot
+
+    def merge(self, snapshot):
+        with self._lock:
+            for name, value in snapshot["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            for name, state in snapshot["histograms"].items():
+                histogram = self.histograms.get(name)
+                if histogram is None:
+                    histogram = self.histograms[name] = Histogram()
+                histogram.merge(state)
+
+    # Returns the hit ratio of each cache, None when it was not used
+    def hit_ratios(self):
+        def ratio(hits, total):
+            return round(hits / total, 4) if total else None
+
+        lookups = self.counter("ns_lookups")
+        history_lookups = self.counter("history_cache_hits") + self.counter("history_cache_misses")
+        verdict_lookups = self.counter("verdicts_reused") + self.counter("verdicts_analysed")
+        table_lookups = self.counter("ns_table_hits") + self.counter("ns_table_misses")
+        return {
+            "history_cache": ratio(self.counter("history_cache_hits"), history_lookups),
+            "verdicts": ratio(self.counter("verdicts_reused"), verdict_lookups),
+            "ns_table": ratio(self.counter("ns_table_hits"), table_lookups),
+            "ns_cache": ratio(lookups - self.histogram("normalize").count, lookups),
+        }
+
+    def to_json(self):
+        snapshot = self.snapshot()
+        for name, state in snapshot["histograms"].items():
+            histogram = Histogram()
+            histogram.merge(state)
+            state["buckets"] = list(BUCKETS)
+            state["p50"] = histogram.percentile(0.50)
+            state["p99"] = histogram.percentile(0.99)
+        snapshot["hit_ratios"] = self.hit_ratios()
+        return json.dumps(snapshot, indent=2)
+
+    # Returns the metrics in the Prometheus text exposition format
+    def prometheus_text(self, prefix="ns_checker_"):
+        snapshot = self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f"# TYPE {prefix}{name}_total counter")
+            lines.append(f"{prefix}{name}_total {value}")
+        for name, value in sorted(snapshot["gauges"].items()):
+            lines.append(f"# TYPE {prefix}{name} gauge")
+            lines.append(f"{prefix}{name} {value}")
+        for name, ratio in sorted(self.hit_ratios().items()):
+            if ratio is not None:
+                lines.append(f"# TYPE {prefix}{name}_hit_ratio gauge")
+                lines.append(f"{prefix}{name}_hit_ratio {ratio}")
+        for name, state in sorted(snapshot["histograms"].items()):
+            metric = f"{prefix}{name}_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, count in zip(BUCKETS, state["counts"]):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{le="{bound:g}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{le="+Inf"}} {state["count"]}')
+            lines.append(f"{metric}_sum {state['sum']}")
+            lines.append(f"{metric}_count {state['count']}")
+        return "\n".join(lines) + "\n"
+
+    # Writes the metrics to `path`: Prometheus text for a .prom file, JSON otherwise.
+    # The file is replaced atomically so it can be scraped while the run goes on.
+    def write(self, path):
+        text = self.prometheus_text() if path.endswith(".prom") else self.to_json()
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as f:
+            f.write(text)
+        os.replace(temp_path, path)
+
+
+# Context manager recording the duration of a block into a histogram
+class StageTimer:
+    __slots__ = ("metrics", "name", "started")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.started)
+
+
+METRICS = Metrics()
+
+
+# Function to format a stage's latency for the summary line
+def format_stage(name, histogram):
+    return f"{name} p50 {histogram.percentile(0.50) * 1000:.1f}ms p99 {histogram.percentile(0.99) * 1000:.1f}ms"
+
+
+# Periodic progress summary of a run, replacing one log line per domain.
+# tick() is called for every processed domain; at most every `interval`
+# seconds it logs the throughput, ETA, stage latencies, requests in flight
+# and cache hit ratios, and refreshes the metrics file when one is set.
+class ProgressReporter:
+    def __init__(self, total=None, done=0, interval=METRICS_INTERVAL, metrics_file=METRICS_FILE, metrics=METRICS):
+        self.total = total
+        self.done = done
+        self.first = done
+        self.interval = interval
+        self.metrics_file = metrics_file
+        self.metrics = metrics
+        self.started = time.monotonic()
+        self.reported_at = self.started
+
+    def tick(self):
+        self.done += 1
+        if self.interval:
+            now = time.monotonic()
+            if now - self.reported_at >= self.interval:
+                self.reported_at = now
+                self.report()
+
+    def summary(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        rate = (self.done - self.first) / elapsed
+        if self.total:
+            progress = f"Processed {self.done}/{self.total} ({100 * self.done // self.total}%)"
+            eta = (self.total - self.done) / rate if rate else None
+        else:
+            progress = f"Processed {self.done}"
+            eta = None
+        parts = [f"{progress}, {rate:.1f} domains/s"]
+        if eta is not None:
+            parts[0] += f", ETA {datetime.timedelta(seconds=round(eta))}"
+        for stage in ("fetch", "analysis", "output"):
+            histogram = self.metrics.histogram(stage)
+            if histogram.count:
+                parts.append(format_stage(stage, histogram))
+        in_flight = self.metrics.gauges.get("api_in_flight")
+        if in_flight is not None:
+            parts.append(f"API in flight {in_flight}")
+        ratios = [
+            f"{name.replace('_', ' ')} {ratio:.0%} hits"
+            for name, ratio in self.metrics.hit_ratios().items()
+            if ratio is not None
+        ]
+        if ratios:
+            parts.append(", ".join(ratios))
+        return " | ".join(parts)
+
+    def report(self):
+        logger.info(self.summary())
+        if self.metrics_file:
+            self.metrics.write(self.metrics_file)
+
+    def close(self):
+        self.report()
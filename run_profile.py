@@ -0,0 +1,135 @@
+import cProfile
+import contextlib
+import functools
+import io
+import linecache
+import pstats
+import tracemalloc
+
+from config import PROFILE_EVERY, PROFILE_TOP
+
+
+# Per-stage tally of the profiled calls: how many, and the peak memory
+# allocated during a call (traced by tracemalloc) over all of them
+class StageMemory:
+    def __init__(self):
+        self.calls = 0
+        self.total_peak = 0
+        self.max_peak = 0
+
+    def add(self, peak):
+        self.calls += 1
+        self.total_peak += peak
+        self.max_peak = max(self.max_peak, peak)
+
+
+# Opt-in cProfile and tracemalloc profiling of a run's hot path.
+# `sampled(func, stage)` profiles one call in every `every` (the first one
+# included); `stage(name)` profiles a whole block. Profiled calls run under
+# cProfile and tracemalloc, which records their peak allocation and the
+# allocation sites still holding memory when they return (e.g. caches that
+# grow). Everything else runs untouched, so with a large `every` the
+# overhead stays low enough for production runs.
+# write(prefix) saves the cProfile data to <prefix>.pstats (for pstats or
+# snakeviz) and the top `top` hot functions and allocation sites to <prefix>.txt.
+class RunProfiler:
+    def __init__(self, every=PROFILE_EVERY, top=PROFILE_TOP):
+        self.every = max(1, every)
+        self.top = top
+        self.profile = cProfile.Profile()
+        self.memory = {}
+        self.allocations = {}  # (file, line) -> [size, count]
+        self.seen = {}
+
+    def sampled(self, func, stage="analysis"):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            seen = self.seen.get(stage, 0)
+            self.seen[stage] = seen + 1
+            if seen % self.every:
+                return func(*args, **kwargs)
+            with self.stage(stage):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    def stage(self, name):
+        return ProfiledBlock(self, name)
+
+    def _record(self, name, peak, snapshot):
+        self.memory.setdefault(name, StageMemory()).add(peak)
+        for stat in snapshot.statistics("lineno"):
+            frame = stat.traceback[0]
+            site = self.allocations.setdefault((frame.filename, frame.lineno), [0, 0])
+            site[0] += stat.size
+            site[1] += stat.count
+
+    def summary(self):
+        out = io.StringIO()
+        out.write(f"Profiled calls (1 in every {self.every}):\n")
+        for name, memory in self.memory.items():
+            out.write(
+                f"  {name}: {memory.calls} calls, peak allocation "
+                f"avg {memory.total_peak / memory.calls / 1024:.1f} KiB, "
+                f"max {memory.max_peak / 1024:.1f} KiB\n"
+            )
+        if not self.memory:
+            out.write("  none\n")
+            return out.getvalue()
+
+        stats = pstats.Stats(self.profile, stream=out)
+        stats.strip_dirs()
+        out.write(f"\nTop {self.top} functions by cumulative time:\n")
+        stats.sort_stats("cumulative").print_stats(self.top)
+        out.write(f"Top {self.top} functions by own time:\n")
+        stats.sort_stats("tottime").print_stats(self.top)
+
+        out.write(f"Top {self.top} allocation sites still holding memory after a profiled call:\n")
+        sites = sorted(self.allocations.items(), key=lambda item: item[1][0], reverse=True)
+        for (filename, lineno), (size, count) in sites[: self.top]:
+            line = linecache.getline(filename, lineno).strip()
+            out.write(f"  {size / 1024:10.1f} KiB {count:8} blocks  {filename}:{lineno}  {line}\n")
+        return out.getvalue()
+
+    # Writes <prefix>.pstats and <prefix>.txt, returns their paths
+    def write(self, prefix):
+        stats_file = f"{prefix}.pstats"
+        summary_file = f"{prefix}.txt"
+        self.profile.dump_stats(stats_file)
+        with open(summary_file, "w") as f:
+            f.write(self.summary())
+        return stats_file, summary_file
+
+
+# A block run under the profiler's cProfile and tracemalloc
+class ProfiledBlock:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.started_tracing = False
+
+    def __enter__(self):
+        self.started_tracing = not tracemalloc.is_tracing()
+        if self.started_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self.before = tracemalloc.get_traced_memory()[0]
+        self.profiler.profile.enable()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.profile.disable()
+        peak = tracemalloc.get_traced_memory()[1] - self.before
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        )
+        if self.started_tracing:
+            tracemalloc.stop()
+        self.profiler._record(self.name, peak, snapshot)
+
+
+# Function to profile a block with `profiler`, or just run it without one
+def profiled(profiler, name):
+    if profiler is None:
+        return contextlib.nullcontext()
+    return profiler.stage(name)
@@ -0,0 +1,122 @@
+import argparse
+import datetime
+import gzip
+import json
+import random
+
+# Nameservers used by the generated histories. The parking hosts match
+# the shipped bad.txt and the expired hosts match expired.txt.
+HOSTING_NS = [
+    ["ns1.cloudflare.com", "ns2.cloudflare.com"],
+    ["dns1.registrar-servers.com", "dns2.registrar-servers.com"],
+    ["ns1.domaincontrol.com", "ns2.domaincontrol.com"],
+    ["ns-1.awsdns-01.org", "ns-2.awsdns-02.net", "ns-3.awsdns-03.com"],
+    ["ns1.hostgator.com", "ns2.hostgator.com"],
+    ["pdns1.ultradns.net", "pdns2.ultradns.net"],
+    ["ns1.1and1.com", "ns1.1and1-dns.de"],
+    ["ns1.google.com", "ns2.google.com"],
+    ["ns1.digitalocean.com", "ns2.digitalocean.com"],
+    ["ns1.linode.com", "ns2.linode.com"],
+]
+PARKING_NS = [
+    ["ns1.above.com", "ns2.above.com"],
+    ["ns1.bodis.com", "ns2.bodis.com"],
+    ["ns1.afternic.com", "ns2.afternic.com"],
+    ["ns1.dan.com", "ns2.dan.com"],
+    ["ns1.parkingcrew.com", "ns2.parkingcrew.com"],
+]
+EXPIRED_NS = [
+    ["expired.reg.com"],
+    ["ns1.whoisguard.com", "ns2.whoisguard.com"],
+    ["ns1.renew-now.net"],
+]
+GAPS = [1, 5, 30, 60, 100, 200, 400, 900]  # Days between two events
+
+
+# Function to pick the nameservers of a new hosting period
+def pick_nameservers(rng, parking_ratio, expired_ratio):
+    roll = rng.random()
+    if roll < parking_ratio:
+        return list(rng.choice(PARKING_NS))
+    if roll < parking_ratio + expired_ratio:
+        return list(rng.choice(EXPIRED_NS))
+    return list(rng.choice(HOSTING_NS))
+
+
+# Function to generate one synthetic CompleteDNS history for `domain`.
+# `events` is the average number of events; `churn` the share of events
+# that move the domain to other nameservers (the others repeat the current
+# ones); `parking_ratio`/`expired_ratio` the share of new nameserver sets
+# taken from parking and expired hosts; `range_ratio` the share of events
+# dated with a start and end date rather than a single date.
+def generate_history(
+    domain,
+    rng,
+    events=12,
+    churn=0.5,
+    parking_ratio=0.1,
+    expired_ratio=0.05,
+    range_ratio=0.5,
+    drop_ratio=0.05,
+):
+    day = datetime.date(2005, 1, 1) + datetime.timedelta(days=rng.randint(0, 6000))
+    nameservers = pick_nameservers(rng, parking_ratio, expired_ratio)
+    history = []
+    for _ in range(rng.randint(0, 2 * events)):
+        day += datetime.timedelta(days=rng.choice(GAPS))
+        if rng.random() < churn:
+            nameservers = pick_nameservers(rng, parking_ratio, expired_ratio)
+        event_type = "change"
+        if rng.random() < drop_ratio:
+            event_type = "dropped"
+        if rng.random() < range_ratio:
+            end = day + datetime.timedelta(days=rng.randint(0, 40))
+            date = {"date_start": day.isoformat(), "date_end": end.isoformat()}
+            day = end
+        else:
+            date = {"date": day.isoformat()}
+        history.append({"nameservers": list(nameservers), "date": date, "type": event_type})
+    return {"domain": domain, "events": history}
+
+
+# Function to generate the history of a domain on its own, the same one
+# every time for a given domain and seed (used by the mock API)
+def history_for(domain, seed=1, **options):
+    return generate_history(domain, random.Random(f"{seed}:{domain}"), **options)
+
+
+# Function to generate `count` histories of domain0.com, domain1.com, ...
+def generate_histories(count, seed=1, **options):
+    for i in range(count):
+        yield history_for(f"domain{i}.com", seed, **options)
+
+
+# Function to add the history generator options to an argument parser
+def add_options(parser):
+    parser.add_argument("--events", type=int, default=12, help="average events per domain")
+    parser.add_argument("--churn", type=float, default=0.5, help="share of events changing the nameservers")
+    parser.add_argument("--parking", type=float, default=0.1, help="share of parking nameserver sets")
+    parser.add_argument("--expired", type=float, default=0.05, help="share of expired nameserver sets")
+    parser.add_argument("--seed", type=int, default=1, help="random seed")
+
+
+# Function to get the generator options from parsed arguments
+def options_from(args):
+    return {
+        "events": args.events,
+        "churn": args.churn,
+        "parking_ratio": args.parking,
+        "expired_ratio": args.expired,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write synthetic CompleteDNS histories as a JSONL dump")
+    parser.add_argument("count", type=int, help="number of domains")
+    parser.add_argument("output", help="output file, gzip-compressed when it ends in .gz")
+    add_options(parser)
+    args = parser.parse_args()
+    opener = gzip.open if args.output.endswith(".gz") else open
+    with opener(args.output, "wt", encoding="utf-8") as f:
+        for record in generate_histories(args.count, args.seed, **options_from(args)):
+            f.write(json.dumps(record) + "\n")
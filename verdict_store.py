@@ -0,0 +1,76 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from config import VERDICT_FILE
+from run_metrics import METRICS
+
+
+# Function to fingerprint the events of a domain's history
+def history_fingerprint(data):
+    events = json.dumps(list(data.get("events", [])), sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(events.encode("utf-8"), digest_size=16).hexdigest()
+
+
+# SQLite store of the last verdict (journal record) of every domain.
+# A verdict is stored with the key it was computed for: the fingerprint of
+# the history plus everything else it depends on (rule files, rule
+# engines, run date). `get` only returns it while the key is unchanged.
+class VerdictStore:
+    def __init__(self, path):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS verdicts ("
+            "domain TEXT PRIMARY KEY, key TEXT NOT NULL, "
+            "record TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def get(self, domain, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT record FROM verdicts WHERE domain = ? AND key = ?", (domain, key)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                METRICS.inc("verdicts_analysed")
+                return None
+            self.hits += 1
+            METRICS.inc("verdicts_reused")
+        return json.loads(row[0])
+
+    def put(self, domain, key, record):
+        body = json.dumps(record, separators=(",", ":"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?)",
+                (domain, key, body, time.time()),
+            )
+
+    def summary(self):
+        return f"Verdicts reused: {self.hits}, analysed: {self.misses}"
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+# Function to open the verdict store configured in config.py
+def get_verdict_store():
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = VerdictStore(os.path.join(os.getcwd(), VERDICT_FILE))
+    return _default_store